@@ -0,0 +1,169 @@
+"""Benchmark the conversion stages on synthetic Poetry projects of increasing size.
+
+Each size is converted a few times, the fastest time per stage is reported together
+with the peak memory of a full conversion. Save a baseline once and later runs show
+the change against it.
+
+    uv run python benchmarks/bench_conversion.py --save
+    uv run python benchmarks/bench_conversion.py [--sizes 10 100 1000 10000] [--v2]
+"""
+
+import argparse
+import json
+import sys
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import tomlkit as tk
+
+import convert_poetry2uv as c2u
+
+BASELINE = Path(__file__).with_name("baseline.json")
+VERSIONS = ["*", "^1.2", "~2.3.4", ">=3.8,<4", "1.0.0", "^0.11.2", ">= 1.8.4, <3.0.0, != 2.8.*"]
+
+
+def _v1_dependencies(deps: int) -> list[str]:
+    """The tool.poetry dependencies, extras and sources of a synthetic v1 project."""
+    extras = max(1, deps // 50)
+    sources = max(1, deps // 500)
+    lines = ["[tool.poetry.dependencies]", 'python = "^3.12"']
+    for i in range(deps // 2):
+        version = VERSIONS[i % len(VERSIONS)]
+        if i < extras:
+            lines.append(f'dep{i} = {{ version = "{version}", extras = ["e{i}", "f{i}"] }}')
+        elif i < extras * 2:
+            lines.append(f'dep{i} = {{ version = "{version}", optional = true }}')
+        elif i < extras * 2 + sources:
+            lines.append(f'dep{i} = {{ version = "{version}", source = "src{i % sources}" }}')
+        elif i < extras * 2 + sources * 2:
+            lines.append(f'dep{i} = {{ path = "libs/dep{i}", develop = true }}')
+        else:
+            lines.append(f'dep{i} = "{version}"')
+    lines += ["", "[tool.poetry.extras]"]
+    lines += [f'x{i} = ["dep{i + extras}"]' for i in range(extras)]
+    for i in range(sources):
+        lines += ["", "[[tool.poetry.source]]", f'name = "src{i}"']
+        lines.append(f'url = "https://index{i}.example.com/simple"')
+    return lines
+
+
+def synthetic_project(deps: int, v2: bool = False) -> str:
+    """Generate a Poetry pyproject.toml with ``deps`` dependencies.
+
+    Groups, extras, sources, path dependencies and tool sections scale along with it.
+    """
+    groups = max(1, deps // 100)
+    tools = max(1, deps // 200)
+    if v2:
+        project_deps = ",\n".join(f'    "pkg{i} (>=1.{i % 10})"' for i in range(deps // 2))
+        lines = [
+            "[project]",
+            'name = "synthetic"',
+            'version = "0.1.0"',
+            'authors = [{ name = "user", email = "user@domain.nl" }]',
+            'requires-python = ">=3.12"',
+            f"dependencies = [\n{project_deps}\n]",
+            "",
+            "[tool.poetry]",
+        ]
+    else:
+        lines = [
+            "[tool.poetry]",
+            'name = "synthetic"',
+            'version = "0.1.0"',
+            'authors = ["user <user@domain.nl>", "<other@domain.nl>"]',
+            'license = "MIT"',
+            "",
+            *_v1_dependencies(deps),
+        ]
+
+    per_group = (deps - deps // 2) // groups
+    for g in range(groups):
+        lines += ["", f"[tool.poetry.group.g{g}.dependencies]"]
+        lines += [f'gdep{g}-{i} = "{VERSIONS[i % len(VERSIONS)]}"' for i in range(per_group)]
+
+    for t in range(tools):
+        lines += ["", f"[tool.tool{t}]", "line-length = 100", 'select = ["E", "W", "F"]']
+        lines += [f"[tool.tool{t}.per-file-ignores]", '"tests/*.py" = ["D", "S101"]']
+    lines += ["", "[build-system]", 'requires = ["poetry-core>=2.0.0"]']
+    lines.append('build-backend = "poetry.core.masonry.api"')
+    return "\n".join(lines) + "\n"
+
+
+def convert_stages(text: str, project_dir: Path) -> dict[str, float]:
+    """Convert the text as the tool does, returning the time in seconds spent in each stage."""
+    profile = c2u.Profile()
+    # The conversion reports things like the removed build system, keep them out of the way.
+    with c2u.collect_diagnostics():
+        rest, verbatim = profile.measure("split_verbatim", c2u.split_verbatim, text)
+        org_toml = profile.measure("parse", tk.loads, rest)
+        new_toml = c2u.Converter(org_toml, c2u.ProjectFiles(project_dir), profile).run()
+        profile.measure("serialization", c2u.render, new_toml, verbatim)
+    return {stage: stats.seconds for stage, stats in profile.items()}
+
+
+def peak_memory(text: str, project_dir: Path) -> int:
+    """Peak memory in bytes of a full conversion."""
+    tracemalloc.start()
+    try:
+        convert_stages(text, project_dir)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench(sizes: list[int], v2: bool, repeat: int) -> dict[str, dict]:
+    """Benchmark each size, returning the fastest stage timings and the peak memory."""
+    project_dir = Path(__file__).parent
+    results = {}
+    for size in sizes:
+        text = synthetic_project(size, v2=v2)
+        runs = [convert_stages(text, project_dir) for _ in range(repeat)]
+        stages = {stage: min(run[stage] for run in runs) for stage in runs[0]}
+        stages["total"] = sum(stages.values())
+        memory = peak_memory(text, project_dir)
+        results[str(size)] = {"stages": stages, "peak_memory": memory}
+    return results
+
+
+def report(results: dict[str, dict], baseline: dict[str, dict]) -> None:
+    """Print the timings in ms per stage, with the change against the baseline."""
+    for size, result in results.items():
+        base = baseline.get(size, {})
+        print(f"\n{size} dependencies")
+        rows = [*result["stages"].items(), ("peak_memory", result["peak_memory"])]
+        for name, value in rows:
+            old = base.get("stages", {}).get(name) if name != "peak_memory" else base.get(name)
+            shown = (
+                f"{value / 1024:>10.0f} KiB"
+                if name == "peak_memory"
+                else f"{value * 1000:>10.2f} ms"
+            )
+            change = f"{(value - old) / old:>+8.1%}" if old else ""
+            print(f"  {name:<20} {shown} {change}")
+
+
+def main() -> None:
+    """Main."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--v2", action="store_true", help="Generate Poetry v2 projects")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument("--save", action="store_true", help="Store the results as baseline")
+    args = parser.parse_args()
+
+    key = "v2" if args.v2 else "v1"
+    stored = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    results = bench(args.sizes, args.v2, args.repeat)
+    report(results, stored.get(key, {}))
+    if args.save:
+        stored[key] = {**stored.get(key, {}), **results}
+        args.baseline.write_text(json.dumps(stored, indent=2) + "\n")
+        print(f"\nBaseline saved to {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
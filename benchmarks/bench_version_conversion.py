@@ -0,0 +1,82 @@
+"""Micro-benchmark for the Poetry version constraint translation.
+
+Compares the original implementation (patterns compiled on every call) with the
+precompiled translator, both without and with the LRU cache.
+
+    uv run python benchmarks/bench_version_conversion.py [-n 200000]
+"""
+
+import argparse
+import random
+import re
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import convert_poetry2uv
+
+CONSTRAINTS = [
+    "*",
+    "^3.12",
+    "^1.2",
+    "^1.2.3",
+    "~1.2.3",
+    "~1.2.*",
+    ">=3.8,<4",
+    ">= 1.8.4, <3.0.0, != 2.8.*",
+    "2.4.10",
+    ">=12.0.0",
+]
+
+
+def legacy_version_conversion(version: str) -> str:
+    """The translation as it was, compiling its patterns on every call."""
+    gt_tilde_version = re.compile(r"[\^~](\d.*)")
+    exact_version = re.compile(r"([\d\.]+)")
+    tilde_with_digits_and_star = re.compile(r"^~([\d\.]+)\.\*")
+    multi_ver_restrictions = re.compile(r"([<>=!]+)[\s,]*([\d\.\*]+),?")
+
+    if version == "*":
+        return ""
+    elif (found := tilde_with_digits_and_star.match(version)) or (
+        found := gt_tilde_version.match(version)
+    ):
+        return f">={found[1]}"
+    elif (found := multi_ver_restrictions.findall(version)) and len(found) >= 1:
+        return ",".join("".join(g) for g in found)
+    elif found := exact_version.match(version):
+        return f"=={found[1]}"
+    return ""
+
+
+def workload(size: int) -> list[str]:
+    """A list of constraints with the repetition seen in real projects."""
+    rng = random.Random(0)  # noqa: S311
+    versions = [f"^{rng.randint(0, 9)}.{rng.randint(0, 30)}" for _ in range(300)]
+    return [rng.choice(CONSTRAINTS + versions) for _ in range(size)]
+
+
+def bench(name: str, func, constraints: list[str]) -> None:
+    """Time one implementation over the workload and print translations per second."""
+    elapsed = min(timeit.repeat(lambda: [func(c) for c in constraints], number=1, repeat=5))
+    print(f"{name:<12} {len(constraints) / elapsed:>14,.0f} translations/s")
+
+
+def main() -> None:
+    """Main."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", type=int, default=200_000, help="Number of translations")
+    args = parser.parse_args()
+
+    constraints = workload(args.n)
+    bench("legacy", legacy_version_conversion, constraints)
+    bench("precompiled", convert_poetry2uv.translate_constraint.__wrapped__, constraints)
+    convert_poetry2uv.translate_constraint.cache_clear()
+    bench("cached", convert_poetry2uv.version_conversion, constraints)
+    print(convert_poetry2uv.translate_constraint.cache_info())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,144 @@
 #!/usr/bin/env python
 """convert_poetry2uv.py: Convert Poetry pyproject.toml to Uv pyproject.toml."""
 
+from __future__ import annotations
+
 import argparse
+import collections
+import contextlib
+import contextvars
+import functools
+import glob
+import importlib.util
+import io
+import itertools
+import json
+import mmap
+import os
 import re
+import shutil
 import sys
-from pathlib import Path
-
-import tomlkit as tk
+import time
+from collections import Counter, defaultdict
+from collections.abc import Callable, Iterable, Iterator
+from dataclasses import asdict, dataclass, field
+from pathlib import Path, PurePosixPath
+from stat import S_ISSOCK
+from types import ModuleType
+from typing import IO, TYPE_CHECKING
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    tomllib = None
+
+
+def lazy_import(name: str) -> ModuleType:
+    """Import a module that is only executed on its first attribute access.
+
+    `--help`, `--version` and files rejected before converting never pay for tomlkit, the
+    process pool or the socket server.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    if (spec := importlib.util.find_spec(name)) is None:
+        raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+if TYPE_CHECKING:
+    import difflib
+    import hashlib
+    import socketserver
+    import subprocess
+    import tracemalloc
+    from concurrent import futures
+    from importlib import metadata
+
+    import tomlkit as tk
+else:
+    difflib = lazy_import("difflib")
+    hashlib = lazy_import("hashlib")
+    socketserver = lazy_import("socketserver")
+    subprocess = lazy_import("subprocess")
+    tracemalloc = lazy_import("tracemalloc")
+    futures = lazy_import("concurrent.futures")
+    metadata = lazy_import("importlib.metadata")
+    tk = lazy_import("tomlkit")
 
-POETRYV2 = False
 __version__ = "0.3.14"
 
+# Classification of a pyproject.toml before converting it.
+POETRY_V1 = "poetry-v1"
+POETRY_V2 = "poetry-v2"
+NOT_POETRY = "not-poetry"
+ALREADY_CONVERTED = "already-converted"
+UV_HEADER = re.compile(rb"^\[(?:tool\.uv[\].]|dependency-groups\])", re.MULTILINE)
+TABLE_HEADER = re.compile(rb"^[ \t]*\[\[?[ \t]*([^\]\s]+)[ \t]*\]", re.MULTILINE)
+NAME_KEY = re.compile(rb"^[ \t]*name[ \t]*=", re.MULTILINE)
+# Tables that are carried over verbatim, and root keys that would define them instead.
+HEADER_LINE = re.compile(
+    r"^[ \t]*\[\[?[ \t]*([\w.\-\"' \t]+?)[ \t]*\]\]?[ \t]*(?:#.*)?$", re.MULTILINE
+)
+ROOT_TOOL_KEY = re.compile(r"^[ \t]*[\"']?(?:tool|build-system)[\"']?[ \t]*[.=]", re.MULTILINE)
+BUILD_BACKEND = re.compile(r"^[ \t]*build-backend[ \t]*=[ \t]*[\"']([^\"']*)", re.MULTILINE)
+
+CONVERTED = "converted"
+SKIPPED = "skipped"
+FAILED = "failed"
+RESTORED = "restored"
+# Outcomes of --check.
+CHANGED = "changed"
+UNCHANGED = "unchanged"
+# Severities of the diagnostics of a conversion.
+INFO = "info"
+WARNING = "warning"
+# When to fsync the written files.
+SYNC_NONE = "none"
+SYNC_FILE = "file"
+SYNC_BATCH = "batch"
+# How the versions locked in poetry.lock seed the converted constraints.
+SEED_BOUNDS = "bounds"
+SEED_CONSTRAINTS = "constraints"
+# Maximum size of the conversion cache in bytes.
+DEFAULT_CACHE_SIZE = 64 * 1024 * 1024
+# Projects per task sent to a worker process, and tasks in flight per worker.
+BATCH_CHUNK_SIZE = 16
+BATCH_CHUNKS_PER_WORKER = 2
+# Threads reading projects ahead of their conversion in each process, and projects read
+# ahead per thread.
+PREFETCH_THREADS = 8
+PREFETCH_PER_THREAD = 2
+# Files at least this large are read through a memory map.
+MMAP_MIN_SIZE = 64 * 1024
+# Entry point group of the transforms run with --entry-points.
+TRANSFORMS_GROUP = "convert_poetry2uv.transforms"
+# Directories never worth descending into when looking for projects.
+IGNORED_DIRS = {".git", ".hg", ".venv", "venv", ".tox", ".nox", "node_modules", "__pycache__"}
+
+# Version constraint patterns, compiled once.
+VERSION_CLAUSE = re.compile(r"\s*(\^|~=|~|===|==|!=|<=|>=|<|>|=)?\s*(\*|v?\d[\w.*+!-]*)\s*,?")
+RELEASE = re.compile(r"v?(\d+(?:\.\d+)*)")
+USER_EMAIL = re.compile(r"^(.*) <(.*)>$")
+ONLY_EMAIL = re.compile(r"^<(.*)>$")
+REQUIREMENT = re.compile(
+    r"(?P<name>[A-Za-z0-9][A-Za-z0-9._-]*)\s*(?P<extras>\[[^\]]*\])?(?P<specifier>.*)"
+)
+BARE_KEY = re.compile(r"[A-Za-z0-9_-]+")
+# The same few hundred constraints repeat across projects, keep their translations around.
+VERSION_CACHE_SIZE = 4096
+
+# Keys Poetry uses to calculate the content-hash of poetry.lock.
+POETRY_LOCK_LEGACY_KEYS = ["dependencies", "source", "extras", "dev-dependencies"]
+POETRY_LOCK_RELEVANT_KEYS = [*POETRY_LOCK_LEGACY_KEYS, "group"]
+POETRY_LOCK_PROJECT_KEYS = ["requires-python", "dependencies", "optional-dependencies"]
+PYPI_SIMPLE_URL = "https://pypi.org/simple"
+PYPI_FILES_URL = "https://files.pythonhosted.org/packages"
+
 
 def argparser() -> argparse.Namespace:
     """Parse command line arguments."""
@@ -19,46 +147,467 @@ def argparser() -> argparse.Namespace:
         description="Poetry to Uv pyproject conversion",
         epilog="It will move the original pyproject.toml to pyproject.toml.org",
     )
-    parser.add_argument("filename")
+    parser.add_argument(
+        "filename",
+        nargs="*",
+        help="pyproject.toml file(s), directories to search recursively or glob patterns",
+    )
     parser.add_argument(
         "-n",
         action="store_true",
         help="Do not modify pyproject.toml, instead create pyproject_temp_uv.toml",
     )
-    return parser.parse_args()
+    parser.add_argument("--version", action="version", version=f"%(prog)s {__version__}")
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="Only compare the conversion with the existing converted file (or --expected),"
+        " exit 1 when they differ. Nothing is written",
+    )
+    parser.add_argument(
+        "--expected",
+        metavar="FILE",
+        help="With --check, compare with FILE instead, relative to each project directory",
+    )
+    parser.add_argument(
+        "--diff",
+        action="store_true",
+        help="With --check, print the differences as a unified diff",
+    )
+    parser.add_argument(
+        "--lock",
+        action="store_true",
+        help="Also convert poetry.lock into uv.lock (uv_temp.lock with -n)",
+    )
+    parser.add_argument(
+        "--seed",
+        choices=[SEED_BOUNDS, SEED_CONSTRAINTS],
+        help="Seed the conversion with the versions locked in poetry.lock: raise the lower"
+        " bounds of the requirements (bounds) or add them as tool.uv constraint-dependencies"
+        " (constraints)",
+    )
+    parser.add_argument(
+        "--git-ref",
+        action="append",
+        metavar="REF",
+        help="Convert the file(s) in memory as they are at the git REF, without checking it out."
+        " Can be given multiple times",
+    )
+    parser.add_argument(
+        "--changed-since",
+        metavar="REF",
+        help="Only convert the projects with files changed since the git REF, and the projects"
+        " depending on them through path dependencies",
+    )
+    parser.add_argument(
+        "--workspace",
+        action="store_true",
+        help="Turn the projects below the directory into the members of a uv workspace rooted"
+        " there, path dependencies between them become workspace sources",
+    )
+    parser.add_argument(
+        "--sync",
+        choices=[SYNC_NONE, SYNC_FILE, SYNC_BATCH],
+        default=SYNC_NONE,
+        help="fsync each written file, or sync once at the end of the run (batch)",
+    )
+    parser.add_argument(
+        "--journal",
+        type=Path,
+        metavar="FILE",
+        help="Record the replaced files in FILE, to undo the run with --restore",
+    )
+    parser.add_argument(
+        "--restore",
+        type=Path,
+        metavar="JOURNAL",
+        help="Restore all pyproject.toml files from their backups, as recorded in JOURNAL",
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="Keep running, converting newline delimited JSON requests read from stdin",
+    )
+    parser.add_argument(
+        "--socket",
+        type=Path,
+        metavar="PATH",
+        help="Keep running, converting newline delimited JSON requests from a Unix socket",
+    )
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="Reuse the results of previous conversions of unchanged projects",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Do not use the cache of previous conversions, overrides --cache and --cache-dir",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        default=None,
+        help="Location of the conversion cache, implies --cache"
+        " (default: ~/.cache/convert_poetry2uv)",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=DEFAULT_CACHE_SIZE // (1024 * 1024),
+        help="Maximum size of the conversion cache in MiB",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Print the time, calls and peak memory of each conversion stage",
+    )
+    parser.add_argument(
+        "--profile-json",
+        type=Path,
+        metavar="FILE",
+        help="Write the statistics of each conversion stage as JSON to FILE",
+    )
+    parser.add_argument(
+        "--plugin",
+        action="append",
+        default=[],
+        metavar="MODULE:FUNCTION",
+        help="Run the transform function(new_toml, org_toml) on each converted document, before"
+        " it is written. Can be given multiple times",
+    )
+    parser.add_argument(
+        "--entry-points",
+        action="store_true",
+        help=f"Run the transforms of the installed {TRANSFORMS_GROUP} entry points as well,"
+        " before those of --plugin",
+    )
+    parser.add_argument(
+        "--diagnostics",
+        type=Path,
+        metavar="FILE",
+        help="Write the diagnostics of all conversions to FILE, one JSON object per line",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of worker processes used when converting multiple projects",
+    )
+    args = parser.parse_args()
+    if not args.filename and not (args.serve or args.socket or args.restore):
+        parser.error("the following arguments are required: filename")
+    if args.workspace and (len(args.filename) != 1 or not Path(args.filename[0]).is_dir()):
+        parser.error("--workspace takes a single directory, the root of the workspace")
+    if args.workspace and (args.lock or args.check or args.git_ref or args.changed_since):
+        # A workspace shares a single uv.lock, the per project poetry.lock do not map onto it.
+        parser.error(
+            "--workspace cannot be combined with --lock, --check, --git-ref or --changed-since"
+        )
+    for spec in args.plugin:
+        try:
+            load_transform(spec)
+        except (ImportError, AttributeError, ValueError) as exc:
+            parser.error(f"--plugin {spec}: {exc}")
+    return args
+
+
+def toml_loads(text: str) -> dict:
+    """Parse TOML into plain python types, using the fast stdlib parser when available."""
+    if tomllib:
+        return tomllib.loads(text)
+    return tk.loads(text).unwrap()
+
+
+def version_conversion(version: str, upper_bounds: bool = True, toml_path: str = "") -> str:
+    """Convert version to uv format, reporting a constraint at toml_path it cannot convert."""
+    try:
+        # str() drops the tomlkit item, so the cache does not keep documents alive.
+        return translate_constraint(str(version), upper_bounds)
+    except ValueError as exc:
+        diagnose("invalid-version", WARNING, str(exc), toml_path)
+        return ""
+
+
+@functools.lru_cache(maxsize=VERSION_CACHE_SIZE)
+def translate_constraint(version: str, upper_bounds: bool = True) -> str:
+    """Translate a Poetry version constraint into an equivalent PEP 440 specifier.
+
+    Caret and tilde constraints keep their upper bound, ``^1.2`` becomes ``>=1.2,<2``,
+    unless ``upper_bounds`` is false (as for requires-python, where uv ignores them).
+    Alternatives joined by ``||`` are merged into a single range, see ``specifier``.
+
+    Results are cached, use ``translate_constraint.cache_info()`` for the hit/miss counters.
+    Raises ``ValueError`` for a constraint that cannot be translated, those are not cached.
+    """
+    alternatives = [parse_clauses(alternative) for alternative in version.split("||")]
+    if None in alternatives:
+        raise ValueError(f"Well, this is an unexpected version: '{version}'. Add it manually.")
+    if len(alternatives) == 1:
+        clauses = [translate_clause(op, v, upper_bounds) for op, v in alternatives[0]]
+        return ",".join(c for clause in clauses for c in clause)
+    if not (versions := version_set(version)):
+        raise ValueError(f"Version {version} allows no version at all, add it manually.")
+    # Not expressible exactly, fall back on the hull: check_equivalence reports it.
+    hull = [(versions[0][0], versions[0][1], versions[-1][2], versions[-1][3])]
+    return specifier(versions) or specifier(hull) or ""
+
+
+# A version range is a list of disjoint intervals, sorted from low to high. An interval
+# is a (low, low inclusive, high, high inclusive) tuple, None bounds are unbounded. The
+# bounds are release tuples without trailing zeros: only final releases are modelled,
+# Poetry and PEP 440 differ in when they allow pre-releases.
+Interval = tuple[tuple[int, ...] | None, bool, tuple[int, ...] | None, bool]
+ANY_VERSION: list[Interval] = [(None, False, None, False)]
 
 
-def version_conversion(version: str) -> str:
-    """Convert version to uv format."""
-    gt_tilde_version = re.compile(r"[\^~](\d.*)")
-    exact_version = re.compile(r"([\d\.]+)")
-    tilde_with_digits_and_star = re.compile(r"^~([\d\.]+)\.\*")
-    multi_ver_restrictions = re.compile(r"([<>=!]+)[\s,]*([\d\.\*]+),?")
+def parse_clauses(constraint: str) -> list[tuple[str, str]] | None:
+    """Split a comma or space separated constraint into ``(operator, version)`` clauses.
 
+    Returns None when the constraint can not be parsed.
+    """
+    clauses, pos = [], 0
+    constraint = constraint.strip()
+    while pos < len(constraint):
+        if not (found := VERSION_CLAUSE.match(constraint, pos)):
+            return None
+        clauses.append((found[1] or "", found[2]))
+        pos = found.end()
+    return clauses or None
+
+
+def release(version: str) -> tuple[int, ...]:
+    """Return the release numbers of a version, e.g. (1, 2, 0) for 1.2.0rc1."""
+    return tuple(int(part) for part in RELEASE.match(version)[1].split("."))
+
+
+def version_key(numbers: tuple[int, ...]) -> tuple[int, ...]:
+    """Normalize release numbers for comparisons, 1.2 equals 1.2.0."""
+    while len(numbers) > 1 and numbers[-1] == 0:
+        numbers = numbers[:-1]
+    return numbers
+
+
+def bump(numbers: tuple[int, ...], index: int) -> tuple[int, ...]:
+    """Increment the release number at index, dropping the numbers after it."""
+    return (*numbers[:index], numbers[index] + 1)
+
+
+def caret_index(numbers: tuple[int, ...]) -> int:
+    """Index of the release number a caret constraint allows to change, ^0.2.3 -> 1."""
+    return next((i for i, n in enumerate(numbers) if n), len(numbers) - 1)
+
+
+def _release_text(numbers: tuple[int, ...]) -> str:
+    """Render release numbers as a version."""
+    return ".".join(map(str, numbers))
+
+
+def translate_clause(op: str, version: str, upper_bounds: bool = True) -> list[str]:
+    """Translate one Poetry constraint clause into PEP 440 clauses."""
     if version == "*":
-        return ""
-    elif (found := tilde_with_digits_and_star.match(version)) or (
-        found := gt_tilde_version.match(version)
+        return []
+    if "*" in version:
+        prefix = version.split(".*", maxsplit=1)[0]
+        return [f"!={prefix}.*" if op == "!=" else f"=={prefix}.*"]
+    if op in ("^", "~"):
+        numbers = release(version)
+        index = caret_index(numbers) if op == "^" else min(1, len(numbers) - 1)
+        upper = [f"<{_release_text(bump(numbers, index))}"] if upper_bounds else []
+        return [f">={version}", *upper]
+    if op in ("", "="):
+        return [f"=={version}"]
+    return [f"{op}{version}"]
+
+
+def clause_intervals(op: str, version: str) -> list[Interval]:
+    """Return the version range of a single Poetry or PEP 440 constraint clause."""
+    if version == "*":
+        return ANY_VERSION
+    numbers = release(version)
+    if "*" in version or op in ("^", "~", "~="):
+        if "*" in version:
+            numbers = release(version.split(".*", maxsplit=1)[0])
+            upper = bump(numbers, len(numbers) - 1)
+        elif op == "^":
+            upper = bump(numbers, caret_index(numbers))
+        else:
+            index = len(numbers) - 2 if op == "~=" else min(1, len(numbers) - 1)
+            upper = bump(numbers, max(index, 0))
+        low, high = version_key(numbers), version_key(upper)
+        if op == "!=":
+            return [(None, False, low, False), (high, True, None, False)]
+        return [(low, True, high, False)]
+    key = version_key(numbers)
+    return {
+        "<": [(None, False, key, False)],
+        "<=": [(None, False, key, True)],
+        ">": [(key, False, None, False)],
+        ">=": [(key, True, None, False)],
+        "!=": [(None, False, key, False), (key, False, None, False)],
+    }.get(op, [(key, True, key, True)])
+
+
+def _tighter(a: tuple, b: tuple, low: bool) -> tuple:
+    """Return the tighter of two ``(bound, inclusive)`` low or high bounds."""
+    if a[0] is None or b[0] is None:
+        return b if a[0] is None else a
+    if a[0] == b[0]:
+        return a[0], a[1] and b[1]
+    return max(a, b) if low else min(a, b)
+
+
+def _intersect(a: list[Interval], b: list[Interval]) -> list[Interval]:
+    """Intersect two version ranges."""
+    result = []
+    for a_low, a_low_inc, a_high, a_high_inc in a:
+        for b_low, b_low_inc, b_high, b_high_inc in b:
+            low = _tighter((a_low, a_low_inc), (b_low, b_low_inc), low=True)
+            high = _tighter((a_high, a_high_inc), (b_high, b_high_inc), low=False)
+            result.append((*low, *high))
+    return _normalize(result)
+
+
+def _normalize(intervals: list[Interval]) -> list[Interval]:
+    """Drop the empty intervals, then sort and merge the overlapping or touching ones."""
+    valid = [
+        (low, low_inc, high, high_inc)
+        for low, low_inc, high, high_inc in intervals
+        if low is None or high is None or low < high or (low == high and low_inc and high_inc)
+    ]
+    valid.sort(key=lambda i: (i[0] is not None, i[0] or (), not i[1]))
+    merged: list[Interval] = []
+    for interval in valid:
+        if merged and _touch(merged[-1], interval):
+            last_low, last_low_inc, last_high, last_high_inc = merged[-1]
+            high = (interval[2], interval[3])
+            if last_high is None or (high[0] is not None and high[0] < last_high):
+                high = last_high, last_high_inc
+            elif high[0] == last_high:
+                high = last_high, high[1] or last_high_inc
+            merged[-1] = (last_low, last_low_inc, *high)
+        else:
+            merged.append(interval)
+    return merged
+
+
+def _touch(first: Interval, second: Interval) -> bool:
+    """Check if the second interval, starting at or after the first, overlaps or touches it."""
+    high, high_inc, low, low_inc = first[2], first[3], second[0], second[1]
+    return high is None or low is None or low < high or (low == high and (low_inc or high_inc))
+
+
+@functools.lru_cache(maxsize=VERSION_CACHE_SIZE)
+def version_set(constraint: str) -> tuple[Interval, ...] | None:
+    """Return the version range of a Poetry constraint or PEP 440 specifier.
+
+    Returns None when the constraint can not be parsed. The ranges are cached, as the
+    conversion and the equivalence check see the same constraints over and over.
+    """
+    ranges = []
+    for alternative in constraint.split("||"):
+        if (clauses := parse_clauses(alternative)) is None:
+            return None
+        versions = ANY_VERSION
+        for op, version in clauses:
+            versions = _intersect(versions, clause_intervals(op, version))
+        ranges += versions
+    return tuple(_normalize(ranges))
+
+
+def specifier(versions: tuple[Interval, ...]) -> str | None:
+    """Render a version range as a PEP 440 specifier, None if it can not be done exactly.
+
+    Gaps between the intervals are excluded with ``!=1.2`` or ``!=2.*`` clauses.
+    """
+    if not versions:
+        return None
+    low, low_inc, _, _ = versions[0]
+    _, _, high, high_inc = versions[-1]
+    if len(versions) == 1 and low is not None and low == high:
+        return f"=={_release_text(low)}"
+    clauses = []
+    if low is not None:
+        clauses.append(f"{'>=' if low_inc else '>'}{_release_text(low)}")
+    if high is not None:
+        clauses.append(f"{'<=' if high_inc else '<'}{_release_text(high)}")
+    for (_, _, gap_low, gap_low_inc), (gap_high, gap_high_inc, _, _) in itertools.pairwise(
+        versions
     ):
-        return f">={found[1]}"
-    elif (found := multi_ver_restrictions.findall(version)) and len(found) >= 1:
-        bundle = ["".join(g) for g in found]
-        return ",".join(bundle)
-    elif found := exact_version.match(version):
-        return f"=={found[1]}"
-    else:
-        print(f"Well, this is an unexpected version\nVersion = {version}\n")
-        print("Skipping this version, add it manually.")
-    return ""
-
+        if gap_low == gap_high and not (gap_low_inc or gap_high_inc):
+            clauses.append(f"!={_release_text(gap_low)}")
+        elif (
+            not gap_low_inc
+            and gap_high_inc
+            and gap_high == version_key(bump(gap_low, len(gap_low) - 1))
+        ):
+            clauses.append(f"!={_release_text(gap_low)}.*")
+        else:
+            return None
+    return ",".join(clauses)
+
+
+def poetry_dependency_tables(
+    poetry: dict, poetry_v2: bool = False
+) -> dict[str, dict[tuple[str, ...], dict]]:
+    """Return the Poetry dependency tables of each group, by their TOML path."""
+    if hasattr(poetry, "unwrap"):
+        # Plain values are walked much faster than the tomlkit items.
+        poetry = poetry.unwrap()
+    tables: dict[str, dict[tuple[str, ...], dict]] = defaultdict(dict)
+    tables["dev"][("tool", "poetry", "dev-dependencies")] = poetry.get("dev-dependencies", {})
+    if not poetry_v2:
+        tables[""][("tool", "poetry", "dependencies")] = poetry.get("dependencies", {})
+    for group, data in poetry.get("group", {}).items():
+        keys = ("tool", "poetry", "group", group, "dependencies")
+        tables[group][keys] = data.get("dependencies", {})
+    return tables
+
+
+def check_equivalence(
+    new_toml: tk.TOMLDocument, org_toml: tk.TOMLDocument, poetry_v2: bool = False
+) -> None:
+    """Check that the converted requirements allow exactly the versions Poetry allowed.
 
-def authors_maintainers(new_toml: tk.TOMLDocument) -> None:
+    Every dependency with a version constraint is compared, per group, as version ranges.
+    Differences are reported as diagnostics.
+    """
+    tables = poetry_dependency_tables(org_toml["tool"]["poetry"], poetry_v2)
+    project = new_toml["project"]
+    converted = {"": [*project.get("dependencies", [])]}
+    for requirements in project.get("optional-dependencies", {}).values():
+        converted[""] += requirements
+    converted.update(new_toml.get("dependency-groups", {}))
+
+    for group, group_tables in tables.items():
+        specifiers = {}
+        for requirement in converted.get(group, []):
+            parsed = parse_requirement(requirement)
+            specifiers[parsed["name"]] = parsed.get("specifier", "")
+        for keys, deps in group_tables.items():
+            for name, value in deps.items():
+                constraint = value.get("version") if isinstance(value, dict) else value
+                key = normalize_name(name)
+                if not isinstance(constraint, str) or key not in specifiers:
+                    continue
+                before, after = version_set(constraint), version_set(specifiers[key] or "*")
+                if before is not None and before != after:
+                    diagnose(
+                        "not-equivalent",
+                        WARNING,
+                        f"The conversion of '{name}' is not equivalent: "
+                        f"'{constraint}' became '{specifiers[key]}', check it manually.",
+                        dotted_key(*keys, name),
+                    )
+
+
+def authors_maintainers(new_toml: tk.TOMLDocument, poetry_v2: bool = False) -> None:
     """Parse authors and maintainers."""
     project = new_toml["project"]
-    user_email = re.compile(r"^(.*) <(.*)>$")
-    only_email = re.compile(r"^<(.*)>$")
 
-    if POETRYV2:
+    # Poetry v2 already uses the uv format.
+    if poetry_v2:
         return
 
     for key in ("authors", "maintainers"):
@@ -66,13 +615,18 @@ def authors_maintainers(new_toml: tk.TOMLDocument) -> None:
             new_authors = tk.array()
             for author in authors:
                 if not isinstance(author, str):
-                    print(f"Expected string in the list of '{key}', got {type(author)}")
+                    diagnose(
+                        "invalid-author",
+                        WARNING,
+                        f"Expected string in the list of '{key}', got {type(author)}",
+                        dotted_key("tool", "poetry", key),
+                    )
                     continue
-                elif found := user_email.match(author):
+                elif found := USER_EMAIL.match(author):
                     name, email = found.groups()
                     tb = tk.inline_table().add("name", name).add("email", email)
                     new_authors.add_line(tb)
-                elif found := only_email.match(author):
+                elif found := ONLY_EMAIL.match(author):
                     email = found[1]
                     new_authors.add_line(tk.inline_table().add("email", email))
                 elif author:
@@ -86,9 +640,9 @@ def authors_maintainers(new_toml: tk.TOMLDocument) -> None:
 
 
 def parse_packages(
-    deps: dict,
+    deps: dict, table: tuple[str, ...] = ()
 ) -> tuple[list[str], dict[str, str], dict[str, str], dict[str, dict]]:
-    """Parse packages."""
+    """Parse packages, of the dependency table at the TOML path table."""
     uv_deps: list[str] = []
     uv_deps_optional: dict[str, str] = {}
     uv_deps_source: dict[str, str] = {}
@@ -97,17 +651,19 @@ def parse_packages(
         if name == "python":
             continue
 
+        path = dotted_key(*table, name)
         if isinstance(value, dict):
             if extras := value.get("extras"):
-                v = value["version"]
-                for i in extras:
-                    extra = f"[{i}]"
-                    uv_deps.append(f"{name}{extra}{version_conversion(v)}")
+                v = version_conversion(value["version"], toml_path=f"{path}.version")
+                uv_deps.append(f"{name}[{','.join(extras)}]{v}")
             elif value.get("optional"):
-                uv_deps_optional[name] = version_conversion(value["version"])
+                uv_deps_optional[name] = version_conversion(
+                    value["version"], toml_path=f"{path}.version"
+                )
             elif source := value.get("source"):
                 uv_deps_source[name] = source
-                uv_deps.append(f"{name}{version_conversion(value['version'])}")
+                v = version_conversion(value["version"], toml_path=f"{path}.version")
+                uv_deps.append(f"{name}{v}")
             elif path := value.get("path"):
                 uv_deps.append(name)
                 tool_uv_sources[name] = {"path": path}
@@ -116,7 +672,7 @@ def parse_packages(
 
             continue
 
-        uv_deps.append(f"{name}{version_conversion(value)}")
+        uv_deps.append(f"{name}{version_conversion(value, toml_path=path)}")
     return (
         uv_deps,
         uv_deps_optional,
@@ -125,81 +681,187 @@ def parse_packages(
     )
 
 
-def group_dependencies(new_toml: tk.TOMLDocument, org_toml: tk.TOMLDocument) -> None:
-    """Parse group dependencies."""
-    if not (groups := org_toml["tool"]["poetry"].get("group", {})) and not org_toml["tool"][
-        "poetry"
-    ].get("dev-dependencies"):
-        return
-
-    new_toml["dependency-groups"] = new_toml.get("dependency-groups", tk.table())
-
-    # Dealing with older dev-dependencies format, without using groups.
-    if "dev-dependencies" in org_toml["tool"]["poetry"]:
-        # I Don't expect the new and old format to be used together, but just in case.
-        if "dev" not in groups:
-            groups["dev"] = {"dependencies": org_toml["tool"]["poetry"]["dev-dependencies"]}
-        elif groups["dev"].get("dependencies"):
-            groups["dev"]["dependencies"].extend(org_toml["tool"]["poetry"]["dev-dependencies"])
+def merge_requirements(requirements: list[str]) -> list[str]:
+    """Merge the requirements of the same package, specifier and marker into one.
+
+    The extras are combined, ``pkg[a]>=1`` and ``pkg[b]>=1`` become ``pkg[a,b]>=1``, and
+    duplicates are dropped. The first spelling of the package name is kept.
+    """
+    merged: dict[tuple[str, str, str], tuple[str, set[str]]] = {}
+    for requirement in requirements:
+        parsed = parse_requirement(requirement)
+        key = (parsed["name"], parsed.get("specifier", ""), parsed.get("marker", ""))
+        name = REQUIREMENT.match(requirement.strip())["name"]
+        merged.setdefault(key, (name, set()))[1].update(parsed.get("extra", []))
+
+    result = []
+    for (_, specifier, marker), (name, extras) in merged.items():
+        extra = f"[{','.join(sorted(extras))}]" if extras else ""
+        result.append(f"{name}{extra}{specifier}" + (f"; {marker}" if marker else ""))
+    return result
+
+
+def multiline_array(items: list[str]) -> tk.items.Array:
+    """Create an array of strings with one item per line.
+
+    Parsing the rendered array is linear, unlike repeated ``Array.add_line`` calls.
+    """
+    if not items:
+        return tk.array()
+    lines = "".join(f"    {tk.string(item).as_string()},\n" for item in items)
+    return tk.parse(f"array = [\n{lines}]\n")["array"]
+
+
+class DependencyModel:
+    """Compact model of the dependencies of a Poetry project.
+
+    The Poetry dependencies are collected first and then emitted into the new document in
+    a single pass, creating each table and array exactly once.
+    """
+
+    __slots__ = ("dependencies", "extras", "groups", "optional", "sources")
+
+    def __init__(self) -> None:
+        """Create an empty model."""
+        self.dependencies: list[str] | None = None
+        self.groups: dict[str, list[str]] | None = None
+        self.optional: dict[str, str] = {}
+        self.extras: dict[str, list[str]] = {}
+        self.sources: dict[str, dict] = {}
+
+    @classmethod
+    def from_poetry(
+        cls, org_toml: tk.TOMLDocument, main: bool = True, groups: bool = True
+    ) -> DependencyModel:
+        """Collect the main and/or group dependencies of the tool.poetry section."""
+        poetry = org_toml["tool"]["poetry"]
+        model = cls()
+        source_names = {entry.get("name") for entry in poetry.get("source", [])}
+        model.extras = poetry.get("extras", {})
+        if main and (deps := poetry.get("dependencies", {})):
+            table = ("tool", "poetry", "dependencies")
+            model.dependencies = model.add_packages(deps, source_names, table)
+
+        group_data = dict(poetry.get("group", {})) if groups else {}
+        # Dealing with older dev-dependencies format, without using groups.
+        if groups and (dev_deps := poetry.get("dev-dependencies")):
+            # I Don't expect the new and old format to be used together, but just in case.
+            dev_group = group_data.get("dev", {}).get("dependencies", {})
+            group_data["dev"] = {"dependencies": {**dev_group, **dev_deps}}
+        if group_data:
+            model.groups = {}
+            for group, data in group_data.items():
+                table = ("tool", "poetry", "group", group, "dependencies")
+                if group == "dev" and "dev" not in poetry.get("group", {}):
+                    table = ("tool", "poetry", "dev-dependencies")
+                deps = data.get("dependencies", {})
+                model.groups[group] = model.add_packages(deps, source_names, table)
+        return model
+
+    def add_packages(
+        self, deps: dict, source_names: set[str], table: tuple[str, ...] = ()
+    ) -> list[str]:
+        """Add the optional dependencies and sources of deps, returning the requirements.
+
+        ``table`` is the TOML path of deps, for the diagnostics.
+        """
+        uv_deps, uv_deps_optional, uv_deps_source, tool_uv_sources = parse_packages(deps, table)
+        self.optional.update(uv_deps_optional)
+        for lib, source in uv_deps_source.items():
+            if source not in source_names:
+                diagnose(
+                    "unknown-source",
+                    WARNING,
+                    f"Source '{source}' of '{lib}' not found in tool.poetry.source",
+                    dotted_key(*table, lib, "source"),
+                )
+            # Packages pinned to a Poetry source are pinned to the uv index of the same name.
+            self.sources[lib] = {"index": source}
+        self.sources.update(tool_uv_sources)
+        return merge_requirements(uv_deps)
+
+    def emit(self, new_toml: tk.TOMLDocument) -> None:
+        """Write the model into the new document."""
+        # The groups first, the layout of the output then matches the one of earlier versions.
+        if self.groups is not None:
+            groups = new_toml.get("dependency-groups", tk.table())
+            for group, deps in self.groups.items():
+                groups.add(group, deps)
+            new_toml["dependency-groups"] = groups
+
+        project = new_toml["project"]
+        if self.dependencies is not None:
+            project["dependencies"] = multiline_array(self.dependencies)
+
+        if self.optional:
+            optional = project.get("optional-dependencies", tk.table())
+            for extra, names in self.extras.items():
+                optional[extra] = [f"{x}{self.optional[x]}" for x in names if x in self.optional]
+            project["optional-dependencies"] = optional
+
+        add_tool_uv_sources(new_toml, self.sources)
 
-    for group, data in groups.items():
-        uv_deps, uv_deps_optional, uv_deps_source, tool_uv_sources = parse_packages(
-            data.get("dependencies", {})
-        )
-        new_toml["dependency-groups"].add(group, uv_deps)
 
-        parse_uv_deps_optional(new_toml, org_toml, uv_deps_optional)
-        parse_uv_deps_sources(new_toml, org_toml, uv_deps_source)
-        add_tool_uv_sources(new_toml, tool_uv_sources)
+def group_dependencies(new_toml: tk.TOMLDocument, org_toml: tk.TOMLDocument) -> None:
+    """Parse group dependencies."""
+    DependencyModel.from_poetry(org_toml, main=False).emit(new_toml)
 
 
 def dependencies(new_toml: tk.TOMLDocument, org_toml: tk.TOMLDocument) -> None:
     """Parse dependencies."""
-    if not (deps := org_toml["tool"]["poetry"].get("dependencies", {})):
-        return
+    DependencyModel.from_poetry(org_toml, groups=False).emit(new_toml)
 
-    uv_deps, uv_deps_optional, uv_deps_source, tool_uv_sources = parse_packages(deps)
-    new_toml["project"]["dependencies"] = tk.array()
-    if uv_deps:
-        for x in uv_deps:
-            new_toml["project"]["dependencies"].add_line(x)
-        new_toml["project"]["dependencies"].add_line(indent="")
 
-    parse_uv_deps_optional(new_toml, org_toml, uv_deps_optional)
-    parse_uv_deps_sources(new_toml, org_toml, uv_deps_source)
-    add_tool_uv_sources(new_toml, tool_uv_sources)
+def poetry_sources(new_toml: tk.TOMLDocument, org_toml: tk.TOMLDocument) -> None:
+    """Convert the Poetry package sources into uv indexes.
 
+    The Poetry priorities map onto uv as: explicit -> ``explicit = true`` (only used by the
+    packages pinned to it), default and primary -> a regular index, the default one first.
+    Supplemental (and the deprecated secondary) sources have no uv equivalent, they become
+    regular indexes, listed after the primary ones. PyPI, the only source without url, is
+    listed with its url, packages pinned to it refer to an index that exists.
 
-def parse_uv_deps_sources(
-    new_toml: tk.TOMLDocument, org_toml: tk.TOMLDocument, uv_deps_source: dict[str, str]
-) -> None:
-    """Parse uv dependencies sources."""
-    if uv_deps_source:
-        if not new_toml.get("tool", {}).get("uv", {}).get("sources"):
-            new_toml["tool"] = {"uv": {"sources": tk.table()}}
-        for lib, source in uv_deps_source.items():
-            for entry in org_toml["tool"]["poetry"]["source"]:
-                if entry.get("name") == source:
-                    url = entry.get("url")
-                    break
-            new_toml["tool"]["uv"]["sources"].add(lib, tk.inline_table().add("git", url))
-
+    Poetry no longer uses PyPI once a primary source is configured, unless PyPI is listed
+    as source. The last primary index then becomes the ``default = true`` index of uv,
+    replacing PyPI. uv searches the default index last, so with supplemental sources that
+    would rank them above it: PyPI is kept as the last index instead, with a diagnostic.
+    """
+    if not (sources := org_toml["tool"]["poetry"].get("source")):
+        return
 
-def parse_uv_deps_optional(
-    new_toml: tk.TOMLDocument,
-    org_toml: tk.TOMLDocument,
-    uv_deps_optional: dict[str, str],
-) -> None:
-    """Parse optional dependencies."""
-    if uv_deps_optional:
-        optional_deps = {
-            extra: [f"{x}{uv_deps_optional[x]}" for x in deps]
-            for extra, deps in org_toml["tool"]["poetry"].pop("extras", {}).items()
-        }
-        new_toml["project"]["optional-dependencies"] = new_toml["project"].get(
-            "optional-dependencies", {}
+    indexes = []
+    for source in sources:
+        priority = source.get("priority") or (
+            "default" if source.get("default") else "secondary" if source.get("secondary") else ""
         )
-        new_toml["project"]["optional-dependencies"].update(optional_deps)
+        index = tk.table().add("name", source["name"])
+        index.add("url", source.get("url") or PYPI_SIMPLE_URL)
+        if priority == "explicit":
+            index.add("explicit", True)
+        supplemental = priority in ("supplemental", "secondary")
+        indexes.append(((supplemental, priority != "default"), index))
+    indexes.sort(key=lambda i: i[0])
+
+    primary = [index for (supplemental, _), index in indexes if not supplemental]
+    primary = [index for index in primary if "explicit" not in index]
+    if primary and not any(source["name"].lower() == "pypi" for source in sources):
+        if any(supplemental for (supplemental, _), _ in indexes):
+            diagnose(
+                "pypi-fallback",
+                WARNING,
+                "PyPI is searched after the supplemental sources, uv cannot replace it by the"
+                " primary sources without ranking the supplemental sources above them",
+                "tool.poetry.source",
+            )
+        else:
+            primary[-1].add("default", True)
+
+    new_toml["tool"] = new_toml.get("tool", tk.table(True))
+    new_toml["tool"]["uv"] = new_toml["tool"].get("uv", tk.table())
+    aot = tk.aot()
+    for _, index in indexes:
+        aot.append(index)
+    new_toml["tool"]["uv"]["index"] = aot
 
 
 def add_tool_uv_sources(
@@ -218,18 +880,104 @@ def add_tool_uv_sources(
             new_toml["tool"]["uv"]["sources"][name].update(data)
 
 
+def workspace_sources(
+    new_toml: tk.TOMLDocument, files: ProjectFiles, members: frozenset[Path]
+) -> None:
+    """Turn the path sources pointing at workspace members into workspace sources.
+
+    The ``members`` are the resolved directories of the projects in the workspace.
+    """
+    sources = new_toml.get("tool", {}).get("uv", {}).get("sources", {})
+    if files.directory is None:
+        return
+    for name, source in list(sources.items()):
+        if "path" in source and (files.directory / source["path"]).resolve() in members:
+            sources[name] = tk.inline_table().add("workspace", True)
+
+
 def tools(new_toml: tk.TOMLDocument, org_toml: tk.TOMLDocument) -> None:
-    """Updates the 'tool' section in the given TOML document."""
+    """Updates the 'tool' section in the given TOML document.
+
+    An existing tool.uv table is merged with the one of the conversion, see ``merge_tables``.
+    """
     if org_toml["tool"]:
         new_toml["tool"] = new_toml.get("tool", tk.table())
         for tool, data in org_toml["tool"].items():
             if tool == "poetry":
                 continue
-            new_toml["tool"][tool] = data
+            if tool == "uv" and "uv" in new_toml["tool"]:
+                merge_tables(new_toml["tool"]["uv"], data)
+            else:
+                new_toml["tool"][tool] = data
     if "tool" in new_toml and not new_toml["tool"]:
         del new_toml["tool"]
 
 
+def merge_tables(target: dict, source: dict) -> None:
+    """Merge the source table into the target table, the values of the target win.
+
+    Tables are merged key by key, arrays of tables get the source entries whose name is
+    not in the target yet, e.g. the indexes of tool.uv.
+    """
+    for key, value in source.items():
+        if key not in target:
+            target[key] = value
+        elif isinstance(target[key], dict) and isinstance(value, dict):
+            merge_tables(target[key], value)
+        elif isinstance(target[key], list) and isinstance(value, list):
+            names = {item.get("name") for item in target[key] if isinstance(item, dict)}
+            for item in value:
+                if not isinstance(item, dict) or item.get("name") not in names:
+                    target[key].append(item)
+
+
+def split_verbatim(text: str) -> tuple[str, str]:
+    """Split the tables that are carried over unchanged from the rest of a pyproject.toml.
+
+    Those are the ``tool`` tables other than Poetry's and uv's (the conversion writes to
+    tool.uv) and a ``build-system`` that is not Poetry's, each from its header up to the
+    next header. Returns the rest of the text, to be converted, and the source of those
+    tables, to be spliced into the output as is.
+    When the tables cannot be sliced reliably (defined by root keys, a ``[tool]`` header,
+    quoted keys or multi-line strings that may hide headers) nothing is split off.
+    """
+    headers = list(HEADER_LINE.finditer(text))
+    if not headers or '"""' in text or "'''" in text:
+        return text, ""
+    if ROOT_TOOL_KEY.search(text, 0, headers[0].start()):
+        return text, ""
+    rest, verbatim = [text[: headers[0].start()]], []
+    for header, following in zip(headers, [*headers[1:], None], strict=True):
+        block = text[header.start() : following.start() if following else len(text)]
+        keys = [key.strip() for key in header[1].split(".")]
+        if (keys[0] == "tool" and len(keys) == 1) or any(q in "".join(keys[:2]) for q in "\"'"):
+            return text, ""
+        (verbatim if is_verbatim_table(keys, block) else rest).append(block)
+    return "".join(rest), "".join(verbatim)
+
+
+def is_verbatim_table(keys: list[str], block: str) -> bool:
+    """Check if the table with the header keys and source block is carried over as is."""
+    if keys[0] == "build-system":
+        return (backend := BUILD_BACKEND.search(block)) is not None and "poetry" not in backend[1]
+    return keys[0] == "tool" and keys[1] not in {"poetry", "uv"}
+
+
+def has_build_system(new_toml: tk.TOMLDocument, verbatim: str) -> bool:
+    """Check if the converted project is packaged, its build-system may be in verbatim."""
+    if "build-system" in new_toml:
+        return True
+    return any(header[1].strip() == "build-system" for header in HEADER_LINE.finditer(verbatim))
+
+
+def render(new_toml: tk.TOMLDocument, verbatim: str = "") -> str:
+    """Serialize the converted document, followed by the tables carried over verbatim."""
+    text = tk.dumps(new_toml)
+    if not verbatim:
+        return text
+    return f"{text.rstrip()}\n\n{verbatim.rstrip()}\n"
+
+
 def poetry_plugins(new_toml: tk.TOMLDocument, org_toml: tk.TOMLDocument) -> None:
     """Updates the 'plugins' section in the given TOML document."""
     if plugins := org_toml["tool"]["poetry"].get("plugins"):
@@ -242,30 +990,112 @@ def build_system(new_toml: tk.TOMLDocument, org_toml: tk.TOMLDocument) -> None:
     """Updates the 'build-system' section in the given TOML document."""
     if build := org_toml.get("build-system"):
         if "poetry" in build.get("build-backend"):
-            print("Poetry build system detected. It will be removed.")
+            diagnose(
+                "build-system-removed",
+                INFO,
+                "Poetry build system detected. It will be removed.",
+                "build-system",
+            )
         else:
             new_toml["build-system"] = org_toml["build-system"]
 
 
+def classify_project(content: bytes) -> str:
+    """Classify a pyproject.toml without the expensive tomlkit parse.
+
+    Returns one of ``POETRY_V1``, ``POETRY_V2``, ``NOT_POETRY`` or ``ALREADY_CONVERTED``.
+    """
+    if b"poetry" in content and tomllib:
+        data = tomllib.loads(content.decode())
+        if "poetry" in data.get("tool", {}):
+            return POETRY_V2 if data.get("project", {}).get("name") else POETRY_V1
+        if "uv" in data.get("tool", {}) or "dependency-groups" in data:
+            return ALREADY_CONVERTED
+        return NOT_POETRY
+    # No mention of poetry at all, or no fast parser (Python < 3.11): scan the table headers.
+    return scan_project_kind(content)
+
+
+def scan_project_kind(content: bytes) -> str:
+    """Classify a pyproject.toml from its table headers, without parsing it."""
+    headers = list(TABLE_HEADER.finditer(content))
+    if any(h[1] == b"tool.poetry" or h[1].startswith(b"tool.poetry.") for h in headers):
+        for header, following in zip(headers, [*headers[1:], None], strict=True):
+            end = following.start() if following else len(content)
+            if header[1] == b"project" and NAME_KEY.search(content, header.end(), end):
+                return POETRY_V2
+        return POETRY_V1
+    return ALREADY_CONVERTED if UV_HEADER.search(content) else NOT_POETRY
+
+
+@dataclass
+class Diagnostic:
+    """An issue found while converting, identified by its code and located by its TOML path."""
+
+    code: str
+    severity: str
+    message: str
+    toml_path: str = ""
+    # The converted file, filled in once the conversion is tied to one.
+    file: str = ""
+
+
+_diagnostics: contextvars.ContextVar[list[Diagnostic] | None] = contextvars.ContextVar(
+    "diagnostics", default=None
+)
+
+
+@contextlib.contextmanager
+def collect_diagnostics() -> Iterator[list[Diagnostic]]:
+    """Collect the diagnostics reported in the block, instead of printing them."""
+    diagnostics: list[Diagnostic] = []
+    token = _diagnostics.set(diagnostics)
+    try:
+        yield diagnostics
+    finally:
+        _diagnostics.reset(token)
+
+
+def diagnose(code: str, severity: str, message: str, toml_path: str = "") -> None:
+    """Report an issue of the current conversion.
+
+    The issue is added to the active ``collect_diagnostics`` block, it is only printed
+    when there is none, e.g. when the conversion functions are called directly.
+    """
+    if (diagnostics := _diagnostics.get()) is None:
+        print(message)
+    else:
+        diagnostics.append(Diagnostic(code, severity, message, toml_path))
+
+
+def dotted_key(*keys: str) -> str:
+    """Join TOML keys into a dotted key, quoting the keys that are not bare."""
+    return ".".join(map(_toml_key, keys))
+
+
+class ConversionError(Exception):
+    """The project can not be converted."""
+
+
 def is_poetry_v2(org_toml: tk.TOMLDocument) -> bool:
     """Check if the project is using Poetry v2 or v1."""
-    global POETRYV2
     # Poetry v2 has a [project] section
     if org_toml.get("project", {}).get("name"):
-        POETRYV2 = True
         return True
     # Poetry v1 has a [tool.poetry] section
     elif org_toml.get("tool", {}).get("poetry").get("name"):
-        POETRYV2 = False
         return False
     else:
-        print("Poetry version not found. Name field not found in tool.poetry or project section")
-        sys.exit(1)
+        raise ConversionError(
+            "Poetry version not found. Name field not found in tool.poetry or project section"
+        )
 
 
-def project_base(new_toml: tk.TOMLDocument, org_toml: tk.TOMLDocument) -> None:  # noqa: C901
+def project_base(  # noqa: C901
+    new_toml: tk.TOMLDocument, org_toml: tk.TOMLDocument, poetry_v2: bool = False
+) -> None:
     """Updates the 'project' section in the given TOML document."""
-    project_base = org_toml["project"] if POETRYV2 else org_toml["tool"]["poetry"]
+    project_base = org_toml["project"] if poetry_v2 else org_toml["tool"]["poetry"]
 
     project = new_toml["project"]
 
@@ -284,7 +1114,9 @@ def project_base(new_toml: tk.TOMLDocument, org_toml: tk.TOMLDocument) -> None:
     if (requirespython := project_base.get("requires-python")) or (
         requirespython := project_base.get("dependencies", {}).get("python")
     ):
-        project.add("requires-python", version_conversion(requirespython))
+        path = "project.requires-python" if poetry_v2 else "tool.poetry.dependencies.python"
+        # uv ignores upper bounds on requires-python, do not add them.
+        project.add("requires-python", version_conversion(requirespython, False, toml_path=path))
     if keywords := project_base.get("keywords"):
         project.add("keywords", keywords)
     if classifiers := project_base.get("classifiers"):
@@ -299,28 +1131,38 @@ def project_base(new_toml: tk.TOMLDocument, org_toml: tk.TOMLDocument) -> None:
         project.add("dependencies", dependencies)
 
 
-def project_license(new_toml: tk.TOMLDocument, project_dir: Path) -> None:
+def project_license(new_toml: tk.TOMLDocument, project_dir: Path | ProjectFiles) -> None:
     """Updates the 'license' field in the given TOML document's 'project' section."""
     project = new_toml["project"]
+    if isinstance(project_dir, Path):
+        project_dir = ProjectFiles(project_dir)
     if (license := project.get("license")) and isinstance(license, str):
-        if project_dir.joinpath(license).exists():
+        if project_dir.exists(license):
             project["license"] = tk.inline_table().add("file", license)
         else:
             project["license"] = tk.inline_table().add("text", license)
 
 
 def poetry_section_specific(
-    new_toml: tk.TOMLDocument, org_toml: tk.TOMLDocument, dir: Path
+    new_toml: tk.TOMLDocument,
+    org_toml: tk.TOMLDocument,
+    dir: Path | ProjectFiles,
+    profile: Profile | None = None,
+    poetry_v2: bool | None = None,
 ) -> None:
     """Convert poetry section specific data."""
-    project_base(new_toml, org_toml)
-    project_license(new_toml, dir)
-    authors_maintainers(new_toml)
-    group_dependencies(new_toml, org_toml)
-    dependencies(new_toml, org_toml)
-    poetry_plugins(new_toml, org_toml)
-    if POETRYV2:
-        v2_dependencies(new_toml)
+    if poetry_v2 is None:
+        poetry_v2 = is_poetry_v2(org_toml)
+    stage = profile.measure if profile is not None else _call
+    stage("project_base", project_base, new_toml, org_toml, poetry_v2)
+    stage("project_license", project_license, new_toml, dir)
+    stage("authors_maintainers", authors_maintainers, new_toml, poetry_v2)
+    model = stage("dependency_model", DependencyModel.from_poetry, org_toml)
+    stage("emit_dependencies", model.emit, new_toml)
+    stage("poetry_plugins", poetry_plugins, new_toml, org_toml)
+    stage("poetry_sources", poetry_sources, new_toml, org_toml)
+    if poetry_v2:
+        stage("v2_dependencies", v2_dependencies, new_toml)
 
 
 def v2_dependencies(new_toml: tk.TOMLDocument) -> None:
@@ -335,41 +1177,1663 @@ def v2_dependencies(new_toml: tk.TOMLDocument) -> None:
             add_tool_uv_sources(new_toml, {package: {"path": full_path}})
 
 
-def main() -> None:
-    """Main."""
-    args = argparser()
-    project_file = Path(args.filename)
-    if not project_file.exists():
-        print(f"File {project_file} not found")
-        return
-    org_toml = tk.loads(project_file.read_text())
-    if "poetry" not in org_toml.get("tool", {}):
-        print("Poetry section not found, are you certain this is a poetry project?")
+def poetry_content_hash(pyproject: dict) -> str:
+    """Calculate the content-hash Poetry stores in poetry.lock for the given pyproject data."""
+    project_content = pyproject.get("project", {})
+    poetry_content = pyproject.get("tool", {}).get("poetry", {})
+
+    relevant_project = {
+        key: project_content[key]
+        for key in POETRY_LOCK_PROJECT_KEYS
+        if project_content.get(key) is not None
+    }
+    relevant_poetry = {}
+    for key in POETRY_LOCK_RELEVANT_KEYS:
+        data = poetry_content.get(key)
+        if data is None and (key not in POETRY_LOCK_LEGACY_KEYS or relevant_project):
+            continue
+        relevant_poetry[key] = data
+
+    if relevant_project:
+        relevant_content = {"project": relevant_project, "tool": {"poetry": relevant_poetry}}
+    else:
+        # Poetry v1 style projects hash the tool.poetry keys at the top level.
+        relevant_content = relevant_poetry
+    return hashlib.sha256(json.dumps(relevant_content, sort_keys=True).encode()).hexdigest()
+
+
+def iter_poetry_lock(lock_lines: Iterable[str]) -> Iterator[tuple[str, dict]]:
+    """Stream the lines of a poetry.lock, yielding a ``(section, data)`` pair per top level block.
+
+    Only a single ``[[package]]`` or ``[metadata]`` block is held in memory at a time.
+    """
+
+    def parse(section: str, lines: list[str]) -> tuple[str, dict]:
+        data = toml_loads("".join(lines))
+        return section, data["package"][0] if section == "package" else data["metadata"]
+
+    section, lines = "", []
+    for line in lock_lines:
+        if line.startswith(("[[package]]", "[metadata]")):
+            if section:
+                yield parse(section, lines)
+            section, lines = line.strip("[]\n"), []
+        if section:
+            lines.append(line)
+    if section:
+        yield parse(section, lines)
+
+
+def normalize_name(name: str) -> str:
+    """Normalize a package name as described in PEP 503."""
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def parse_requirement(requirement: str) -> dict:
+    """Split a requirement string into a uv lock requirement table."""
+    requirement, _, marker = requirement.partition(";")
+    found = REQUIREMENT.match(requirement.strip())
+    name, extras, specifier = found["name"], found["extras"], found["specifier"]
+    parsed: dict = {"name": normalize_name(name)}
+    if extras:
+        extras = (e.strip() for e in extras.strip("[]").split(","))
+        parsed["extra"] = [normalize_name(e) for e in extras if e]
+    if specifier := specifier.strip().strip("()").replace(" ", ""):
+        parsed["specifier"] = specifier
+    if marker := marker.strip():
+        parsed["marker"] = marker
+    return parsed
+
+
+def _toml_key(key: str) -> str:
+    """Render a TOML key, only quoting it when needed."""
+    return key if BARE_KEY.fullmatch(key) else json.dumps(key)
+
+
+def _toml_inline(data: dict) -> str:
+    """Render a flat dict as a TOML inline table."""
+    return "{ " + ", ".join(f"{k} = {json.dumps(v)}" for k, v in data.items()) + " }"
+
+
+def _toml_array(items: list[dict], key: str) -> list[str]:
+    """Render a list of dicts as a multi-line TOML array of inline tables."""
+    if not items:
+        return []
+    return [f"{key} = [", *(f"    {_toml_inline(i)}," for i in items), "]"]
+
+
+def uv_lock_source(package: dict) -> dict:
+    """Translate the source of a poetry.lock package into a uv.lock source."""
+    source = package.get("source", {})
+    kind, url = source.get("type"), source.get("url", "")
+    if kind == "git":
+        rev = source.get("reference") or source.get("resolved_reference")
+        return {"git": f"{url}?rev={rev}#{source.get('resolved_reference', rev)}"}
+    elif kind == "directory":
+        return {"editable" if package.get("develop") else "directory": url}
+    elif kind == "file":
+        return {"path": url}
+    elif kind == "url":
+        return {"url": url}
+    elif kind == "legacy":
+        return {"registry": url}
+    return {"registry": PYPI_SIMPLE_URL}
+
+
+def uv_lock_files(package: dict, source: dict) -> tuple[dict | None, list[dict]]:
+    """Build the sdist and wheels entries of a uv.lock package.
+
+    Poetry only records file names, so download urls are only known for PyPI.
+    """
+    if source.get("registry") != PYPI_SIMPLE_URL:
+        return None, []
+    name = package["name"]
+    sdist, wheels = None, []
+    for file in package.get("files", []):
+        filename, file_hash = file["file"], file["hash"]
+        if filename.endswith(".whl"):
+            python_tag = filename.split("-")[-3]
+            url = f"{PYPI_FILES_URL}/{python_tag}/{name[0]}/{name}/{filename}"
+            wheels.append({"url": url, "hash": file_hash})
+        elif sdist is None:
+            url = f"{PYPI_FILES_URL}/source/{name[0]}/{name}/{filename}"
+            sdist = {"url": url, "hash": file_hash}
+    return sdist, wheels
+
+
+def uv_lock_dependencies(deps: dict, locked: set[str]) -> list[dict]:
+    """Translate the dependencies of a poetry.lock package, skipping unlocked ones."""
+    uv_deps = []
+    for dep_name, constraint in deps.items():
+        name = normalize_name(dep_name)
+        if name not in locked:
+            continue
+        # A single dependency may have a list of constraints, one per marker.
+        for entry in constraint if isinstance(constraint, list) else [constraint]:
+            dep: dict = {"name": name}
+            if isinstance(entry, dict):
+                if entry.get("optional"):
+                    continue
+                if extras := entry.get("extras"):
+                    dep["extra"] = extras
+                if markers := entry.get("markers"):
+                    dep["marker"] = markers
+            if dep not in uv_deps:
+                uv_deps.append(dep)
+    return uv_deps
+
+
+def render_uv_lock_package(package: dict, locked: set[str]) -> str:
+    """Render one poetry.lock package as a uv.lock ``[[package]]`` block."""
+    source = uv_lock_source(package)
+    lines = [
+        "[[package]]",
+        f"name = {json.dumps(normalize_name(package['name']))}",
+        f"version = {json.dumps(package['version'])}",
+        f"source = {_toml_inline(source)}",
+    ]
+    lines += _toml_array(
+        uv_lock_dependencies(package.get("dependencies", {}), locked), "dependencies"
+    )
+    sdist, wheels = uv_lock_files(package, source)
+    if sdist:
+        lines.append(f"sdist = {_toml_inline(sdist)}")
+    lines += _toml_array(wheels, "wheels")
+
+    optional = {}
+    for extra, requirements in package.get("extras", {}).items():
+        names = {parse_requirement(r)["name"] for r in requirements}
+        optional[normalize_name(extra)] = [{"name": n} for n in sorted(names & locked)]
+    if optional := {k: v for k, v in optional.items() if v}:
+        lines += ["", "[package.optional-dependencies]"]
+        for extra, extra_deps in optional.items():
+            lines.append(f"{_toml_key(extra)} = [{', '.join(map(_toml_inline, extra_deps))}]")
+    return "\n".join(lines)
+
+
+def render_uv_lock_project(new_toml: tk.TOMLDocument, locked: set[str], editable: bool) -> str:
+    """Render the converted project itself as a uv.lock ``[[package]]`` block."""
+    project = new_toml["project"]
+    tool_uv = new_toml.get("tool", {}).get("uv", {})
+    sources = tool_uv.get("sources", {})
+    index_urls = {index["name"]: index["url"] for index in tool_uv.get("index", [])}
+
+    def requirements(reqs: list[str]) -> list[dict]:
+        parsed = [parse_requirement(r) for r in reqs]
+        for req in parsed:
+            source = sources.get(req["name"], {})
+            if "path" in source:
+                req["editable" if source.get("editable") else "directory"] = source["path"]
+            elif source.get("index") in index_urls:
+                req["index"] = index_urls[source["index"]]
+        return parsed
+
+    def names(reqs: list[dict]) -> list[dict]:
+        unique = {r["name"] for r in reqs if r["name"] in locked}
+        return [{"name": n} for n in sorted(unique)]
+
+    requires_dist = requirements(project.get("dependencies", []))
+    requires_dev = {
+        group: requirements(reqs) for group, reqs in new_toml.get("dependency-groups", {}).items()
+    }
+    lines = [
+        "[[package]]",
+        f"name = {json.dumps(normalize_name(project['name']))}",
+        f"version = {json.dumps(str(project['version']))}",
+        f"source = {_toml_inline({'editable' if editable else 'virtual': '.'})}",
+    ]
+    lines += _toml_array(names(requires_dist), "dependencies")
+    if requires_dev:
+        lines += ["", "[package.dev-dependencies]"]
+        for group, reqs in requires_dev.items():
+            lines.append(f"{_toml_key(group)} = [{', '.join(map(_toml_inline, names(reqs)))}]")
+    lines += ["", "[package.metadata]"]
+    lines += _toml_array(requires_dist, "requires-dist") or ["requires-dist = []"]
+    if requires_dev:
+        lines += ["", "[package.metadata.requires-dev]"]
+        for group, reqs in requires_dev.items():
+            lines.append(f"{_toml_key(group)} = [{', '.join(map(_toml_inline, reqs))}]")
+    return "\n".join(lines)
+
+
+def read_poetry_lock(files: ProjectFiles) -> tuple[list[dict], dict]:
+    """Return the packages and the metadata of the poetry.lock in files."""
+    packages, metadata = [], {}
+    for section, data in iter_poetry_lock(files.lines("poetry.lock")):
+        if section == "package":
+            packages.append(data)
+        else:
+            metadata = data
+    return packages, metadata
+
+
+def locked_versions(packages: list[dict]) -> dict[str, str]:
+    """Return the version of each package locked from an index, by normalized name.
+
+    Packages locked at more than one version (for different markers) are left out.
+    """
+    versions: dict[str, str | None] = {}
+    for package in packages:
+        if package.get("source", {}).get("type") not in (None, "legacy"):
+            continue
+        name = normalize_name(package["name"])
+        versions[name] = package["version"] if name not in versions else None
+    return {name: version for name, version in versions.items() if version}
+
+
+def seed_requirement(requirement: str, version: str) -> str:
+    """Raise the lower bound of a requirement to the locked version.
+
+    Requirements pinned to an exact version are returned unchanged. The Poetry 2 form
+    ``name (>=1,<2)`` is written without the parentheses.
+    """
+    parsed = parse_requirement(requirement)
+    clauses = [c for c in parsed.get("specifier", "").split(",") if c]
+    if any(c.startswith("==") for c in clauses):
+        return requirement
+    clauses = [f">={version}", *(c for c in clauses if not c.startswith(">"))]
+    found = REQUIREMENT.match(requirement.partition(";")[0].strip())
+    marker = f"; {parsed['marker']}" if "marker" in parsed else ""
+    return f"{found['name']}{found['extras'] or ''}{','.join(clauses)}{marker}"
+
+
+def seed_from_lock(
+    new_toml: tk.TOMLDocument, content_hash: str, files: ProjectFiles, mode: str
+) -> str:
+    """Seed the converted constraints with the versions Poetry locked, returning a message.
+
+    With ``SEED_BOUNDS`` the lower bounds of the requirements are raised to the locked
+    versions. With ``SEED_CONSTRAINTS`` every locked package is pinned in the
+    ``constraint-dependencies`` of tool.uv. Either way the first ``uv lock`` starts from
+    the versions Poetry resolved. An out of date poetry.lock is not used.
+    """
+    lock_file = files.describe("poetry.lock")
+    if not files.exists("poetry.lock"):
+        return "No poetry.lock found, the constraints are not seeded"
+    packages, metadata = read_poetry_lock(files)
+    if metadata.get("content-hash") != content_hash:
+        return f"{lock_file} is out of date with pyproject.toml, the constraints are not seeded"
+    versions = locked_versions(packages)
+
+    if mode == SEED_CONSTRAINTS:
+        new_toml["tool"] = new_toml.get("tool", tk.table(True))
+        new_toml["tool"]["uv"] = new_toml["tool"].get("uv", tk.table())
+        pins = [f"{name}=={version}" for name, version in sorted(versions.items())]
+        new_toml["tool"]["uv"]["constraint-dependencies"] = multiline_array(pins)
+        return f"Pinned {len(pins)} packages of {lock_file} as constraint-dependencies"
+
+    project = new_toml["project"]
+    requirement_lists = [
+        project.get("dependencies", []),
+        *project.get("optional-dependencies", {}).values(),
+        *new_toml.get("dependency-groups", {}).values(),
+    ]
+    seeded = 0
+    for requirements in requirement_lists:
+        for i, requirement in enumerate(requirements):
+            name = parse_requirement(requirement)["name"]
+            if name in versions:
+                requirements[i] = seed_requirement(requirement, versions[name])
+                seeded += 1
+    return f"Raised the lower bounds of {seeded} requirements to the versions in {lock_file}"
+
+
+def convert_lock(
+    content_hash: str,
+    new_toml: tk.TOMLDocument,
+    files: ProjectFiles,
+    output_name: str,
+    packaged: bool,
+) -> tuple[str | None, str]:
+    """Convert a poetry.lock into a uv.lock, reusing the versions Poetry already resolved.
+
+    A ``packaged`` project, one with a build system, is locked as editable, otherwise as
+    virtual. Returns the uv.lock content and a message. The conversion is refused (content
+    ``None``) when the lock does not match the ``content_hash`` of the original
+    pyproject.toml, see ``poetry_content_hash``, or when it holds several versions of a
+    package.
+    """
+    lock_file = files.describe("poetry.lock")
+    if not files.exists("poetry.lock"):
+        return None, "No poetry.lock found, skipping the lock file conversion"
+
+    packages, metadata = read_poetry_lock(files)
+    if metadata.get("content-hash") != content_hash:
+        message = f"{lock_file} is out of date with pyproject.toml, {output_name} not created"
+        return None, message
+
+    counts = Counter(normalize_name(package["name"]) for package in packages)
+    if forked := sorted(name for name, count in counts.items() if count > 1):
+        # uv tells the versions apart with resolution markers, which Poetry does not record.
+        diagnose(
+            "forked-lock",
+            WARNING,
+            f"{lock_file} locks several versions of {', '.join(forked)}, which uv.lock cannot"
+            " express without resolving again. Run 'uv lock' instead.",
+        )
+        return None, f"{lock_file} locks several versions of a package, {output_name} not created"
+
+    # Lock format 1.x keeps the file hashes in the metadata section.
+    for package in packages:
+        if "files" not in package:
+            package["files"] = metadata.get("files", {}).get(package["name"], [])
+
+    locked = {normalize_name(p["name"]) for p in packages}
+    blocks = [(normalize_name(p["name"]), render_uv_lock_package(p, locked)) for p in packages]
+    project_name = normalize_name(new_toml["project"]["name"])
+    blocks.append((project_name, render_uv_lock_project(new_toml, locked, packaged)))
+    blocks.sort()
+
+    requires_python = new_toml["project"].get("requires-python") or version_conversion(
+        metadata.get("python-versions", "*"), upper_bounds=False
+    )
+
+    header = f"version = 1\nrevision = 2\nrequires-python = {json.dumps(requires_python)}"
+    content = "\n\n".join([header, *(block for _, block in blocks)]) + "\n"
+    return content, f"Converted {lock_file} into {output_name}"
+
+
+class ProjectFiles:
+    """The files next to a pyproject.toml, on disk.
+
+    Without a directory there are no files at all, as for a document converted in memory.
+    """
+
+    def __init__(self, directory: Path | None) -> None:
+        """Access the files in directory."""
+        self.directory = directory
+        # Filled in by prefetch: the names in the directory and the contents read ahead.
+        self.names: set[str] | None = None
+        self.contents: dict[str, bytes] = {}
+
+    def prefetch(self, name: str, lock: bool = False) -> ProjectFiles:
+        """List the directory and read the file ahead of the conversion, returning self.
+
+        With ``lock`` the kernel starts reading the poetry.lock as well, the conversion
+        maps it into memory once it gets to it.
+        """
+        try:
+            self.names = set(os.listdir(self.directory))
+        except OSError:
+            return self
+        if name in self.names:
+            with contextlib.suppress(OSError):
+                self.contents[name] = self.directory.joinpath(name).read_bytes()
+        if lock and "poetry.lock" in self.names:
+            readahead(self.directory / "poetry.lock")
+        return self
+
+    def read(self, name: str) -> bytes | None:
+        """Return the content of the file, None if it does not exist."""
+        if name in self.contents:
+            return self.contents.pop(name)
+        if not self.exists(name):
+            return None
+        try:
+            return self.directory.joinpath(name).read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def exists(self, name: str) -> bool:
+        """Check if the file exists, from the directory listing when it was prefetched."""
+        if self.directory is None:
+            return False
+        if self.names is not None and "/" not in name and os.sep not in name:
+            return name in self.names
+        return self.directory.joinpath(name).exists()
+
+    def lines(self, name: str) -> Iterator[str]:
+        """Stream the lines of a text file, through a memory map for large files."""
+        if self.directory is None:
+            return
+        with self.directory.joinpath(name).open("rb") as fh:
+            if os.fstat(fh.fileno()).st_size < MMAP_MIN_SIZE:
+                yield from io.TextIOWrapper(fh, encoding="utf-8")
+                return
+            with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                for line in iter(mapped.readline, b""):
+                    yield line.decode().replace("\r\n", "\n")
+
+    def describe(self, name: str) -> str:
+        """Where the file comes from, for messages and reports."""
+        return str(self.directory / name) if self.directory is not None else name
+
+
+def readahead(path: Path) -> None:
+    """Let the kernel start reading a file in the background, where it is supported."""
+    if not hasattr(os, "posix_fadvise"):
         return
+    with contextlib.suppress(OSError):
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        finally:
+            os.close(fd)
+
+
+def iter_prefetched(
+    project_files: Iterable[Path], lock: bool = False
+) -> Iterator[tuple[Path, ProjectFiles]]:
+    """Yield the projects in order, with their files read ahead by a pool of threads.
+
+    A bounded number of projects is read ahead, so the filesystem latency of the next
+    projects overlaps with the conversion of the current one. ``lock`` reads the
+    poetry.lock ahead as well, see ``ProjectFiles.prefetch``.
+    """
+    pending: collections.deque = collections.deque()
+    with futures.ThreadPoolExecutor(PREFETCH_THREADS) as executor:
+        for project_file in project_files:
+            files = ProjectFiles(project_file.parent)
+            pending.append((project_file, executor.submit(files.prefetch, project_file.name, lock)))
+            if len(pending) >= PREFETCH_THREADS * PREFETCH_PER_THREAD:
+                done, future = pending.popleft()
+                yield done, future.result()
+        while pending:
+            done, future = pending.popleft()
+            yield done, future.result()
+
+
+class GitObjectReader:
+    """Read files from git objects through one long-lived ``git cat-file --batch`` process."""
+
+    def __init__(self, repo: Path) -> None:
+        """Start the cat-file process for the repository."""
+        self.repo = repo
+        self.process = subprocess.Popen(
+            ["git", "-C", str(repo), "cat-file", "--batch"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+
+    def object(self, name: str) -> tuple[bytes, bytes] | None:
+        """Return the type and content of the named object, None if it does not exist."""
+        self.process.stdin.write(f"{name}\n".encode())
+        self.process.stdin.flush()
+        # "<oid> <type> <size>", or "<name> missing" where the name may hold spaces.
+        header = self.process.stdout.readline().rsplit(maxsplit=2)
+        if len(header) != 3 or header[-1] in (b"missing", b"ambiguous"):
+            return None
+        data = self.process.stdout.read(int(header[2]))
+        self.process.stdout.read(1)  # The newline following each object.
+        return header[1], data
+
+    def read(self, ref: str, path: str) -> bytes | None:
+        """Return the content of path at ref, None if it does not exist."""
+        found = self.object(f"{ref}:{path}")
+        return found[1] if found and found[0] == b"blob" else None
+
+    def has_commit(self, ref: str) -> bool:
+        """Check if the ref resolves to a commit."""
+        return self.object(f"{ref}^{{commit}}") is not None
+
+    def close(self) -> None:
+        """Stop the cat-file process."""
+        self.process.stdin.close()
+        self.process.wait()
+
+    def __enter__(self) -> GitObjectReader:  # noqa: PYI034
+        """Use the reader as context manager."""
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        """Stop the cat-file process."""
+        self.close()
+
+
+class GitProjectFiles(ProjectFiles):
+    """The files next to a pyproject.toml, at a git ref."""
+
+    def __init__(self, reader: GitObjectReader, ref: str, directory: PurePosixPath) -> None:
+        """Access the files in directory (relative to the repository root) at ref."""
+        self.reader = reader
+        self.ref = ref
+        self.directory = directory
+        # Each file is read from the git objects once, e.g. checked and then read.
+        self.blobs: dict[str, bytes | None] = {}
+
+    def read(self, name: str) -> bytes | None:
+        """Return the content of the file, None if it does not exist."""
+        if name not in self.blobs:
+            self.blobs[name] = self.reader.read(self.ref, str(self.directory / name))
+        return self.blobs[name]
+
+    def exists(self, name: str) -> bool:
+        """Check if the file exists."""
+        return self.read(name) is not None
+
+    def lines(self, name: str) -> Iterator[str]:
+        """Return the lines of a text file."""
+        return iter((self.read(name) or b"").decode().splitlines(keepends=True))
+
+    def describe(self, name: str) -> str:
+        """Where the file comes from, for messages and reports."""
+        return f"{self.ref}:{self.directory / name}"
+
+
+def _call(_name: str, func: Callable, *args):
+    """Call func, the unprofiled counterpart of ``Profile.measure``."""
+    return func(*args)
+
+
+@dataclass
+class StageStats:
+    """Wall time, number of calls and peak memory of a conversion stage."""
+
+    calls: int = 0
+    seconds: float = 0.0
+    peak_memory: int = 0
+
+
+class Profile(dict[str, StageStats]):
+    """Per stage statistics of one or more conversions."""
+
+    def measure(self, name: str, func: Callable, *args):
+        """Call func, recording its statistics under the stage name."""
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+            memory_before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            stats = self.setdefault(name, StageStats())
+            stats.calls += 1
+            stats.seconds += time.perf_counter() - start
+            if tracing:
+                peak = tracemalloc.get_traced_memory()[1] - memory_before
+                stats.peak_memory = max(stats.peak_memory, peak)
+
+    def merge(self, other: Profile) -> None:
+        """Add the statistics of another profile, e.g. of another file in a batch."""
+        for name, other_stats in other.items():
+            stats = self.setdefault(name, StageStats())
+            stats.calls += other_stats.calls
+            stats.seconds += other_stats.seconds
+            stats.peak_memory = max(stats.peak_memory, other_stats.peak_memory)
+
+    def table(self) -> str:
+        """Render the statistics as a table."""
+        lines = [f"{'stage':<20} {'calls':>7} {'total ms':>10} {'mean ms':>9} {'peak KiB':>9}"]
+        for name, stats in self.items():
+            lines.append(
+                f"{name:<20} {stats.calls:>7} {stats.seconds * 1000:>10.2f} "
+                f"{stats.seconds * 1000 / stats.calls:>9.3f} {stats.peak_memory / 1024:>9.0f}"
+            )
+        return "\n".join(lines)
+
+    def to_json(self) -> str:
+        """Render the statistics as JSON."""
+        return json.dumps({name: asdict(stats) for name, stats in self.items()}, indent=2)
+
+
+@dataclass
+class ConversionResult:
+    """Outcome of converting a single project file."""
+
+    path: Path
+    status: str
+    message: str = ""
+    profile: Profile | None = None
+    # Where the input was read from when it was not the path itself, e.g. a git ref.
+    source: str = ""
+    diagnostics: list[Diagnostic] = field(default_factory=list)
+
+
+@dataclass
+class ConversionCache:
+    """On-disk cache of conversion results, keyed by a hash of everything that affects them."""
+
+    directory: Path
+    max_size: int = DEFAULT_CACHE_SIZE
+
+    def key(  # noqa: PLR0913
+        self,
+        content: bytes,
+        project_dir: Path,
+        lock: bool,
+        lock_output: str = "",
+        *,
+        seed: str | None = None,
+        workspace: frozenset[Path] | None = None,
+        transforms: Iterable[str] = (),
+    ) -> str:
+        """Hash the input file, the sibling files the conversion looks at and the tool version.
+
+        The project directory and the ``lock_output`` name are part of the key, as they
+        appear in the messages of the conversion, as are the ``workspace`` members and the
+        specs of the ``transforms``. Changes to the code of a transform are not detected.
+        """
+        digest = hashlib.sha256(f"{__version__}\0{lock}\0{lock_output}\0{seed}\0".encode())
+        for member in sorted(workspace or ()):
+            digest.update(f"{member}\0".encode())
+        for name in transforms:
+            digest.update(f"transform:{name}\0".encode())
+        digest.update(f"{project_dir.resolve()}\0".encode())
+        digest.update(content)
+        data = toml_loads(content.decode())
+        for section in (data.get("project", {}), data.get("tool", {}).get("poetry", {})):
+            if isinstance(license := section.get("license"), str):
+                digest.update(f"\0{license}={project_dir.joinpath(license).exists()}".encode())
+        if (lock or seed) and (lock_file := project_dir / "poetry.lock").exists():
+            digest.update(b"\0" + hashlib.sha256(lock_file.read_bytes()).digest())
+        return digest.hexdigest()
+
+    def convert(self, key: str, func: Callable, *args, **kwargs) -> dict:
+        """Return the cached conversion for the key, or call func and cache its result.
+
+        The diagnostics are part of the conversion, a hit reports them again.
+        """
+        if converted := self.get(key):
+            return converted
+        converted = func(*args, **kwargs)
+        self.put(key, converted)
+        return converted
+
+    def get(self, key: str) -> dict | None:
+        """Return the cached conversion for the key, if any."""
+        entry = self.directory / f"{key}.json"
+        try:
+            data = json.loads(entry.read_text())
+        except (OSError, ValueError):
+            return None
+        entry.touch()  # Mark as recently used for the eviction.
+        return data
+
+    def put(self, key: str, data: dict) -> None:
+        """Store a conversion, atomically so concurrent workers never see partial entries."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.directory / f"{key}.{os.getpid()}.tmp"
+        tmp_file.write_text(json.dumps(data))
+        tmp_file.replace(self.directory / f"{key}.json")
+
+    def evict(self) -> None:
+        """Remove the least recently used entries until the cache fits in ``max_size`` bytes."""
+        if not self.directory.is_dir():
+            return
+        entries = [(e.stat(), e) for e in self.directory.glob("*.json")]
+        total = sum(stat.st_size for stat, _ in entries)
+        for stat, entry in sorted(entries, key=lambda e: e[0].st_mtime):
+            if total <= self.max_size:
+                break
+            entry.unlink(missing_ok=True)
+            total -= stat.st_size
+
+
+def default_cache_dir() -> Path:
+    """Return the directory of the conversion cache."""
+    cache_home = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(cache_home) / "convert_poetry2uv"
+
+
+def _fsync(path: Path) -> None:
+    """Persist the data of a file, or the entries of a directory e.g. after a rename."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def write_atomic(path: Path, text: str, fsync: bool = False) -> None:
+    """Write a file through a temporary file in the same directory and an atomic replace."""
+    tmp_file = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        with tmp_file.open("w", encoding="utf-8") as fh:
+            fh.write(text)
+            if fsync:
+                fh.flush()
+                os.fsync(fh.fileno())
+        tmp_file.replace(path)
+    finally:
+        tmp_file.unlink(missing_ok=True)
+    if fsync:
+        _fsync(path.parent)
+
+
+def backup(project_file: Path, backup_file: Path, fsync: bool = False) -> None:
+    """Atomically create (or replace) the backup, keeping the original in place."""
+    tmp_file = backup_file.with_name(f".{backup_file.name}.{os.getpid()}.tmp")
+    try:
+        try:
+            os.link(project_file, tmp_file)
+        except OSError:
+            # Not every filesystem supports hard links.
+            shutil.copy2(project_file, tmp_file)
+            if fsync:
+                _fsync(tmp_file)
+        tmp_file.replace(backup_file)
+    finally:
+        tmp_file.unlink(missing_ok=True)
+    if fsync:
+        _fsync(backup_file.parent)
+
+
+def backup_outputs(project_file: Path, lock_file: Path | None, fsync: bool = False) -> dict:
+    """Back up the files a conversion is about to replace, returning their journal entry.
+
+    The paths in the entry are absolute, so the journal can be restored from any directory.
+    """
+    backup_file = project_file.with_name(f"{project_file.name}.org")
+    backup(project_file, backup_file, fsync)
+    entry = {"file": str(project_file.resolve()), "backup": str(backup_file.resolve())}
+    entry["backups"], entry["created"] = {}, []
+    if lock_file and lock_file.exists():
+        lock_backup = lock_file.with_name(f"{lock_file.name}.org")
+        backup(lock_file, lock_backup, fsync)
+        entry["backups"][str(lock_file.resolve())] = str(lock_backup.resolve())
+    elif lock_file:
+        entry["created"].append(str(lock_file.resolve()))
+    return entry
+
+
+def record_journal(journal: Path, entry: dict) -> None:
+    """Append an entry to the journal, a single write so parallel workers do not interleave."""
+    fd = os.open(journal, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, (json.dumps(entry) + "\n").encode())
+    finally:
+        os.close(fd)
+
+
+def restore_journal(journal: Path) -> list[ConversionResult]:
+    """Undo the changes recorded in the journal of an (aborted) run.
+
+    Each pyproject.toml (and replaced uv.lock) is restored from its .org backup and the
+    files the run created are removed, in reverse order.
+    """
+    entries = [json.loads(line) for line in journal.read_text().splitlines() if line.strip()]
+    results = []
+    for entry in reversed(entries):
+        project_file, backup_file = Path(entry["file"]), Path(entry["backup"])
+        if not backup_file.exists():
+            results.append(ConversionResult(project_file, FAILED, f"{backup_file} not found"))
+            continue
+        backup_file.replace(project_file)
+        for original, other_backup in entry.get("backups", {}).items():
+            if Path(other_backup).exists():
+                Path(other_backup).replace(original)
+        for created in entry.get("created", []):
+            Path(created).unlink(missing_ok=True)
+        results.append(ConversionResult(project_file, RESTORED, f"Restored from {backup_file}"))
+    return results
+
+
+def skip_reason(content: bytes) -> str | None:
+    """Return why the pyproject.toml content is not converted, None if it should be."""
+    kind = classify_project(content)
+    if kind == ALREADY_CONVERTED:
+        return "Already converted to uv, nothing to do"
+    elif kind == NOT_POETRY:
+        return "Poetry section not found, are you certain this is a poetry project?"
+    return None
+
+
+def convert_project(  # noqa: PLR0913
+    project_file: Path,
+    *,
+    dry_run: bool = False,
+    lock: bool = False,
+    cache: ConversionCache | None = None,
+    profile: bool = False,
+    sync: str = SYNC_NONE,
+    journal: Path | None = None,
+    seed: str | None = None,
+    workspace: frozenset[Path] | None = None,
+    files: ProjectFiles | None = None,
+    plugins: tuple[str, ...] = (),
+) -> ConversionResult:
+    """Convert a single Poetry pyproject.toml file.
+
+    With ``lock`` the sibling poetry.lock is converted into a uv.lock as well. With
+    ``seed`` the constraints are seeded from the poetry.lock, see ``seed_from_lock``. With a
+    ``cache`` an unchanged project is written from the cache without converting it again.
+    With ``profile`` the result holds the statistics of each conversion stage. The
+    ``workspace`` members are referred to as workspace sources, see ``convert_workspace``.
+    ``files`` are the files of the project directory when they were read ahead, see
+    ``iter_prefetched``. The transforms of the ``plugins`` specs run on the converted
+    document, see ``load_transforms``.
+
+    Files are replaced atomically, after the original is backed up. ``sync`` is one of
+    ``SYNC_NONE``, ``SYNC_FILE`` (fsync each file) or ``SYNC_BATCH`` (the caller syncs
+    once at the end). The changes are recorded in the ``journal``, see ``restore_journal``.
+    """
+    files = files or ProjectFiles(project_file.parent)
+    if (content := files.read(project_file.name)) is None:
+        return ConversionResult(project_file, SKIPPED, f"File {project_file} not found")
+    if reason := skip_reason(content):
+        return ConversionResult(project_file, SKIPPED, reason)
 
-    dry_run = args.n
     project_dir = project_file.parent
     backup_file = project_dir / f"{project_file.name}.org"
+    lock_output = project_dir / ("uv_temp.lock" if dry_run else "uv.lock")
     if dry_run:
         output_file = Path(project_dir / "pyproject_temp_uv.toml")
-        print(f"Dry_run enabled. Output file: {output_file}")
+        message = f"Dry_run enabled. Output file: {output_file}"
     else:
-        print(f"Replacing {project_file}\nBackup file : {backup_file}")
         output_file = project_file
+        message = f"Replacing {project_file}\nBackup file : {backup_file}"
+
+    stats = Profile() if profile else None
+    args = (content, files, lock, lock_output.name)
+    kwargs = {"profile": stats, "seed": seed, "workspace": workspace, "plugins": plugins}
+    if cache:
+        cache_key = cache.key(
+            content,
+            project_dir,
+            lock,
+            lock_output.name,
+            seed=seed,
+            workspace=workspace,
+            transforms=plugins,
+        )
+        converted = cache.convert(cache_key, convert_content, *args, **kwargs)
+    else:
+        converted = convert_content(*args, **kwargs)
 
-    new_toml = tk.document()
-    new_toml["project"] = tk.table()
+    fsync = sync == SYNC_FILE
+    write_lock = lock and converted["lock"] is not None
+    if not dry_run:
+        entry = backup_outputs(project_file, lock_output if write_lock else None, fsync)
+        message += "".join(f"\nBackup file : {b}" for b in entry["backups"].values())
+        # Only recorded once the backups exist, a restore never uses stale backups.
+        if journal:
+            record_journal(journal, entry)
+
+    write_atomic(output_file, converted["pyproject"], fsync)
+    if lock:
+        if write_lock:
+            write_atomic(lock_output, converted["lock"], fsync)
+        message += "\n" + converted["lock_message"]
+    if seed:
+        message += "\n" + converted["seed_message"]
+    diagnostics = converted_diagnostics(converted, str(project_file))
+    return ConversionResult(project_file, CONVERTED, message, stats, diagnostics=diagnostics)
+
+
+def check_project(  # noqa: PLR0913
+    project_file: Path,
+    *,
+    expected: str | None = None,
+    lock: bool = False,
+    diff: bool = False,
+    seed: str | None = None,
+    files: ProjectFiles | None = None,
+    plugins: tuple[str, ...] = (),
+) -> ConversionResult:
+    """Convert a project in memory and compare the result with the expected output.
+
+    A converted project is compared with the conversion of its .org backup. ``expected``
+    is a golden file to compare with instead, relative to the project directory. With
+    ``lock`` the uv.lock is compared as well, ``seed`` and ``plugins`` are passed on to the
+    conversion as for ``convert_project``. Nothing is written, the result is
+    ``UNCHANGED`` or ``CHANGED``, with a unified diff as message when ``diff`` is set.
+    ``files`` are the files of the project directory, as for ``convert_project``.
+    """
+    project_dir = project_file.parent
+    files = files or ProjectFiles(project_dir)
+    if (content := files.read(project_file.name)) is None:
+        return ConversionResult(project_file, SKIPPED, f"File {project_file} not found")
+    if classify_project(content) == ALREADY_CONVERTED and (
+        backup := files.read(f"{project_file.name}.org")
+    ):
+        content = backup
+    if reason := skip_reason(content):
+        return ConversionResult(project_file, SKIPPED, reason)
+
+    converted = convert_content(content, files, lock, seed=seed, plugins=plugins)
+    outputs = [(project_dir / (expected or project_file.name), converted["pyproject"])]
+    if lock and converted["lock"] is not None:
+        outputs.append((project_dir / "uv.lock", converted["lock"]))
+
+    messages = []
+    for output_file, text in outputs:
+        current = output_file.read_text() if output_file.exists() else ""
+        if current == text:
+            continue
+        messages.append(f"{output_file} differs from the conversion")
+        if diff:
+            messages += difflib.unified_diff(
+                current.splitlines(),
+                text.splitlines(),
+                str(output_file),
+                f"{output_file} (converted)",
+                lineterm="",
+            )
+    diagnostics = converted_diagnostics(converted, str(project_file))
+    if messages:
+        return ConversionResult(project_file, CHANGED, "\n".join(messages), diagnostics=diagnostics)
+    message = f"{outputs[0][0]} is up to date"
+    return ConversionResult(project_file, UNCHANGED, message, diagnostics=diagnostics)
+
+
+def process_project(project_file: Path, *, check: bool = False, **options) -> ConversionResult:
+    """Convert a project, or with ``check`` only compare its conversion, see ``check_project``."""
+    if check:
+        return check_project(project_file, **options)
+    return convert_project(project_file, **options)
+
+
+class Converter:
+    """Converts a single Poetry pyproject document.
+
+    All state of the conversion lives on the instance, separate conversions can run
+    concurrently, e.g. from a thread pool.
+    """
+
+    def __init__(
+        self,
+        org_toml: tk.TOMLDocument,
+        files: ProjectFiles | None = None,
+        profile: Profile | None = None,
+        workspace: frozenset[Path] | None = None,
+        transforms: Iterable[tuple[str, Callable]] = (),
+    ) -> None:
+        """Prepare the conversion of org_toml, with the files next to it for the license.
+
+        ``workspace`` holds the member directories when converting into a uv workspace.
+        The named ``transforms`` are called with the new and the original document once
+        the conversion is done, see ``load_transforms``.
+        """
+        self.org_toml = org_toml
+        self.files = files or ProjectFiles(None)
+        self.profile = profile
+        self.workspace = workspace
+        self.transforms = transforms
+        self.poetry_v2 = is_poetry_v2(org_toml)
+        self.new_toml = tk.document()
+        self.new_toml["project"] = tk.table()
+
+    def run(self) -> tk.TOMLDocument:
+        """Convert the document, returning the uv pyproject document."""
+        stage = self.profile.measure if self.profile is not None else _call
+        poetry_section_specific(
+            self.new_toml, self.org_toml, self.files, self.profile, self.poetry_v2
+        )
+        stage("build_system", build_system, self.new_toml, self.org_toml)
+        stage("tools", tools, self.new_toml, self.org_toml)
+        if self.workspace:
+            stage("workspace", workspace_sources, self.new_toml, self.files, self.workspace)
+        stage("equivalence", check_equivalence, self.new_toml, self.org_toml, self.poetry_v2)
+        for name, transform in self.transforms:
+            stage(f"plugin:{name}", transform, self.new_toml, self.org_toml)
+        return self.new_toml
+
+
+def load_transform(spec: str) -> Callable:
+    """Import the transform function of a ``module:function`` spec."""
+    module_name, _, attr = spec.partition(":")
+    if not module_name or not attr:
+        raise ValueError(f"expected MODULE:FUNCTION, got {spec!r}")
+    transform = importlib.import_module(module_name)
+    for name in attr.split("."):
+        transform = getattr(transform, name)
+    return transform
+
+
+def entry_point_specs() -> tuple[str, ...]:
+    """Return the ``module:function`` specs of the installed ``TRANSFORMS_GROUP`` entry points.
+
+    They are ordered by the names of the entry points. Looking them up scans all installed
+    distributions, it only happens when asked for with --entry-points.
+    """
+    entry_points = sorted(metadata.entry_points(group=TRANSFORMS_GROUP), key=lambda ep: ep.name)
+    return tuple(entry_point.value for entry_point in entry_points)
+
+
+@functools.cache
+def load_transforms(plugins: tuple[str, ...]) -> tuple[tuple[str, Callable], ...]:
+    """Load the transforms of the ``plugins`` specs, named by their spec.
+
+    Each is called as ``transform(new_toml, org_toml)`` in the given order and changes the
+    new document in place, it can report issues with ``diagnose``. They are loaded once per
+    process.
+    """
+    return tuple((spec, load_transform(spec)) for spec in plugins)
+
+
+def convert_document(
+    org_toml: tk.TOMLDocument | dict, *, project_dir: Path | None = None
+) -> tk.TOMLDocument:
+    """Convert a parsed Poetry pyproject document (or dict) into a uv pyproject document.
+
+    ``project_dir`` is only used to check if the license refers to a file.
+    """
+    return Converter(org_toml, ProjectFiles(project_dir)).run()
+
+
+def convert(text: str, *, project_dir: Path | None = None) -> str:
+    """Convert the text of a Poetry pyproject.toml into the text of a uv pyproject.toml.
+
+    Nothing is read or written, apart from checking in ``project_dir`` if the license
+    refers to a file. Raises ``ConversionError`` when the text is not a Poetry project.
+    """
+    if reason := skip_reason(text.encode()):
+        raise ConversionError(reason)
+    text, verbatim = split_verbatim(text)
+    return render(convert_document(tk.loads(text), project_dir=project_dir), verbatim)
+
+
+def convert_content(  # noqa: PLR0913
+    content: bytes,
+    files: ProjectFiles,
+    lock: bool,
+    lock_output: str = "uv.lock",
+    *,
+    profile: Profile | None = None,
+    seed: str | None = None,
+    workspace: frozenset[Path] | None = None,
+    plugins: tuple[str, ...] = (),
+) -> dict:
+    """Convert the content of a Poetry pyproject.toml and optionally its poetry.lock.
+
+    The ``files`` next to the pyproject.toml are used for the license and poetry.lock.
+    When a ``profile`` is given, the time and memory of each stage are recorded in it.
+    With ``seed`` the constraints are seeded from the poetry.lock, see ``seed_from_lock``.
+    The diagnostics of the conversion are returned as dicts, see ``converted_diagnostics``.
+    The transforms of the ``plugins`` specs run on the converted document, see
+    ``load_transforms``. It then holds all tables, as the transforms may change any of them.
+    """
+    transforms = load_transforms(plugins) if plugins else ()
+    stage = profile.measure if profile is not None else _call
+    tracing = profile is not None and not tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.start()
+    try:
+        with collect_diagnostics() as diagnostics:
+            # Unchanged tables skip tomlkit altogether, they are spliced into the output.
+            text, verbatim = content.decode(), ""
+            if not transforms:
+                text, verbatim = split_verbatim(text)
+            org_toml = stage("parse", tk.loads, text)
+            # The conversion modifies org_toml, hash the original content up front.
+            content_hash = poetry_content_hash(org_toml.unwrap()) if lock or seed else ""
+            new_toml = Converter(org_toml, files, profile, workspace, transforms).run()
+
+            converted = {}
+            if seed:
+                converted["seed_message"] = stage(
+                    "seed", seed_from_lock, new_toml, content_hash, files, seed
+                )
+            converted["pyproject"] = stage("serialization", render, new_toml, verbatim)
+            if lock:
+                converted["lock"], converted["lock_message"] = stage(
+                    "lock",
+                    convert_lock,
+                    content_hash,
+                    new_toml,
+                    files,
+                    lock_output,
+                    has_build_system(new_toml, verbatim),
+                )
+    finally:
+        if tracing:
+            tracemalloc.stop()
+    converted["diagnostics"] = [asdict(diagnostic) for diagnostic in diagnostics]
+    return converted
+
+
+def converted_diagnostics(converted: dict, file: str) -> list[Diagnostic]:
+    """Return the diagnostics of a conversion, of the given file."""
+    return [Diagnostic(**{**data, "file": file}) for data in converted.get("diagnostics", [])]
+
+
+def _git(directory: Path, *args: str) -> str:
+    """Run a git command in directory, returning its output."""
+    git = subprocess.run(
+        ["git", "-C", str(directory), *args],
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    if git.returncode:
+        raise ConversionError(git.stderr.strip() or f"git {args[0]} failed in {directory}")
+    return git.stdout
+
+
+def git_toplevel(directory: Path) -> Path:
+    """Return the root of the git repository holding directory."""
+    return Path(_git(directory, "rev-parse", "--show-toplevel").strip()).resolve()
+
+
+def changed_files(ref: str, directories: Iterable[Path]) -> set[Path]:
+    """Return the files changed since the git ref, including untracked files.
+
+    The repositories are those holding the directories, the paths are absolute.
+    """
+    toplevels: set[Path] = set()
+    for directory in map(Path.resolve, directories):
+        if not any(directory.is_relative_to(toplevel) for toplevel in toplevels):
+            toplevels.add(git_toplevel(directory))
+
+    changed = set()
+    for toplevel in toplevels:
+        for args in (
+            ("diff", "--name-only", "-z", ref, "--"),
+            ("ls-files", "-z", "--others", "--exclude-standard"),
+        ):
+            changed.update(toplevel / name for name in _git(toplevel, *args).split("\0") if name)
+    return changed
+
+
+def path_dependencies(project_file: Path) -> set[Path]:
+    """Return the directories of the path dependencies of a Poetry project."""
+    try:
+        data = toml_loads(project_file.read_text())
+    except (OSError, ValueError):
+        return set()
+    poetry = data.get("tool", {}).get("poetry", {})
+    tables = [poetry.get("dependencies", {}), poetry.get("dev-dependencies", {})]
+    tables += [group.get("dependencies", {}) for group in poetry.get("group", {}).values()]
+    paths = [
+        value["path"]
+        for table in tables
+        for value in table.values()
+        if isinstance(value, dict) and "path" in value
+    ]
+    # Poetry v2 style dependencies refer to local projects by file url.
+    for requirement in data.get("project", {}).get("dependencies", []):
+        url = requirement.partition("@")[2].strip()
+        if url.startswith("file://"):
+            paths.append(url.removeprefix("file://"))
+    return {(project_file.parent / path).resolve() for path in paths}
+
+
+def affected_projects(project_files: list[Path], changed: set[Path]) -> list[Path]:
+    """Select the projects holding changed files, and the projects depending on them by path.
+
+    A changed file belongs to the deepest project directory holding it.
+    """
+    directories = {project_file.parent.resolve(): project_file for project_file in project_files}
+    affected = set()
+    for path in changed:
+        if owner := next((p for p in path.parents if p in directories), None):
+            affected.add(owner)
+
+    dependents = defaultdict(set)
+    for directory, project_file in directories.items():
+        for dependency in path_dependencies(project_file):
+            dependents[dependency].add(directory)
+    todo = list(affected)
+    while todo:
+        for dependent in dependents[todo.pop()] - affected:
+            affected.add(dependent)
+            todo.append(dependent)
+    return [project_file for d, project_file in directories.items() if d in affected]
+
+
+def convert_workspace(root: Path, jobs: int = 1, **options) -> Iterator[ConversionResult]:
+    """Convert the projects below root into the members of a uv workspace rooted there.
+
+    Path dependencies between members become ``{ workspace = true }`` sources, so the
+    whole tree shares one lock and one environment. The results of the projects are
+    yielded as they complete, followed by the one of the root, see
+    ``write_workspace_root``. The ``options`` are passed on to ``convert_project``.
+    """
+    root = root.resolve()
+    project_files = list(iter_projects([str(root)]))
+    # Files without a project, e.g. only holding tool settings, cannot be members.
+    members = [
+        project_file.parent
+        for project_file in project_files
+        if project_file.parent != root and classify_project(project_file.read_bytes()) != NOT_POETRY
+    ]
+    options["workspace"] = frozenset(members)
+    root_converted = False
+    for result in iter_convert(project_files, jobs, **options):
+        if result.path.parent == root:
+            root_converted = result.status == CONVERTED
+        yield result
+    yield write_workspace_root(
+        root,
+        members,
+        converted=root_converted,
+        dry_run=options.get("dry_run", False),
+        fsync=options.get("sync") == SYNC_FILE,
+        journal=options.get("journal"),
+    )
 
-    global POETRYV2
-    POETRYV2 = is_poetry_v2(org_toml)
-    poetry_section_specific(new_toml, org_toml, dir=project_dir)
-    build_system(new_toml, org_toml)
-    tools(new_toml, org_toml)
 
-    if not dry_run:
-        project_file.rename(backup_file)
+def write_workspace_root(  # noqa: PLR0913
+    root: Path,
+    members: list[Path],
+    *,
+    converted: bool = False,
+    dry_run: bool = False,
+    fsync: bool = False,
+    journal: Path | None = None,
+) -> ConversionResult:
+    """List the members in the ``[tool.uv.workspace]`` of the root pyproject.toml.
+
+    The root pyproject.toml is created when there is none, a virtual workspace root. When
+    ``converted`` it was converted in this run, the workspace is added to its conversion.
+    An existing root is backed up (and recorded in the ``journal``) before it is replaced.
+    """
+    project_file = root / "pyproject.toml"
+    output_file = root / "pyproject_temp_uv.toml" if dry_run else project_file
+    current = output_file if converted else project_file
+    content = current.read_bytes() if current.exists() else b""
+    if classify_project(content) in (POETRY_V1, POETRY_V2):
+        message = "Not converted, the workspace members are not added"
+        return ConversionResult(project_file, FAILED, message)
+
+    document = tk.loads(content.decode())
+    if "tool" not in document:
+        document["tool"] = tk.table(True)
+    if "uv" not in document["tool"]:
+        document["tool"]["uv"] = tk.table(True)
+    paths = sorted(member.relative_to(root).as_posix() for member in members)
+    document["tool"]["uv"]["workspace"] = tk.table().add("members", multiline_array(paths))
+
+    if project_file.exists() and not (dry_run or converted):
+        entry = backup_outputs(project_file, None, fsync)
+        if journal:
+            record_journal(journal, entry)
+    write_atomic(output_file, tk.dumps(document), fsync)
+    message = f"Workspace of {len(members)} members written to {output_file}"
+    return ConversionResult(project_file, CONVERTED, message, source=f"{project_file} (workspace)")
+
+
+def convert_git_refs(
+    project_file: Path,
+    refs: list[str],
+    lock: bool = False,
+    profile: bool = False,
+    plugins: tuple[str, ...] = (),
+) -> list[ConversionResult]:
+    """Convert a pyproject.toml in memory as it is at each of the git refs.
+
+    The files are read from the git objects, without checking out the refs. ``plugins`` are
+    passed on to the conversion as for ``convert_project``.
+    """
+    if project_file.is_dir():
+        project_file = project_file / "pyproject.toml"
+    try:
+        toplevel = git_toplevel(project_file.parent)
+    except ConversionError as exc:
+        return [
+            ConversionResult(project_file, FAILED, str(exc), source=f"{ref}:{project_file}")
+            for ref in refs
+        ]
+    path = PurePosixPath(project_file.resolve().relative_to(toplevel).as_posix())
+    with GitObjectReader(toplevel) as reader:
+        return [_convert_git_ref(reader, ref, path, lock, profile, plugins=plugins) for ref in refs]
+
+
+def _convert_git_ref(  # noqa: PLR0913
+    reader: GitObjectReader,
+    ref: str,
+    path: PurePosixPath,
+    lock: bool,
+    profile: bool,
+    *,
+    plugins: tuple[str, ...] = (),
+) -> ConversionResult:
+    """Convert the pyproject.toml at path in ref, turning any error into a failed result."""
+    source = f"{ref}:{path}"
+    try:
+        if not reader.has_commit(ref):
+            return ConversionResult(Path(path), FAILED, "Git ref not found", source=source)
+        if (content := reader.read(ref, str(path))) is None:
+            return ConversionResult(Path(path), SKIPPED, "File not found", source=source)
+        if reason := skip_reason(content):
+            return ConversionResult(Path(path), SKIPPED, reason, source=source)
+        stats = Profile() if profile else None
+        files = GitProjectFiles(reader, ref, path.parent)
+        converted = convert_content(content, files, lock, profile=stats, plugins=plugins)
+    except (Exception, SystemExit) as exc:  # noqa: BLE001
+        return ConversionResult(Path(path), FAILED, f"{type(exc).__name__}: {exc}", source=source)
+    message = "Converted in memory"
+    if lock:
+        message += "\n" + converted["lock_message"]
+    diagnostics = converted_diagnostics(converted, source)
+    return ConversionResult(Path(path), CONVERTED, message, stats, source, diagnostics)
+
+
+def _convert_project_safe(project_file: Path, **options) -> ConversionResult:
+    """Convert a project, turning any error into a failed result."""
+    try:
+        return process_project(project_file, **options)
+    except (Exception, SystemExit) as exc:  # noqa: BLE001
+        return ConversionResult(project_file, FAILED, f"{type(exc).__name__}: {exc}")
+
+
+def discover_projects(paths: list[str]) -> list[Path]:
+    """Find all pyproject.toml files below the given files, directories or glob patterns."""
+    return list(iter_projects(paths))
+
+
+def iter_projects(paths: list[str]) -> Iterator[Path]:
+    """Yield the pyproject.toml files below the given files, directories or glob patterns.
+
+    Directories are walked lazily. Files found through more than one of the paths are only
+    yielded once, that bookkeeping is skipped for a single path, which never overlaps.
+    """
+    seen: set[Path] | None = set() if len(paths) > 1 else None
+    for project_file in _walk_projects(paths):
+        if seen is not None:
+            if project_file in seen:
+                continue
+            seen.add(project_file)
+        yield project_file
+
+
+def _walk_projects(paths: list[str]) -> Iterator[Path]:
+    """Yield the pyproject.toml files below each of the paths, possibly more than once."""
+    for entry in paths:
+        path = Path(entry)
+        if path.is_file():
+            yield path
+        elif path.is_dir():
+            for root, dirs, files in os.walk(path):
+                dirs[:] = sorted(d for d in dirs if d not in IGNORED_DIRS)
+                if "pyproject.toml" in files:
+                    yield Path(root) / "pyproject.toml"
+        else:
+            for match in sorted(glob.glob(entry, recursive=True)):
+                match_path = Path(match)
+                if match_path.is_dir():
+                    yield from _walk_projects([match])
+                elif match_path.name == "pyproject.toml":
+                    yield match_path
 
-    output_file.write_text(tk.dumps(new_toml))
+
+def _convert_chunk(project_files: list[Path], **options) -> list[ConversionResult]:
+    """Convert a chunk of projects in a worker process."""
+    return list(_convert_prefetched(project_files, **options))
+
+
+def _convert_prefetched(project_files: Iterable[Path], **options) -> Iterator[ConversionResult]:
+    """Convert projects one by one, while the next ones are read ahead."""
+    lock = bool(options.get("lock") or options.get("seed"))
+    for project_file, files in iter_prefetched(project_files, lock):
+        yield _convert_project_safe(project_file, files=files, **options)
+
+
+def convert_batch(project_files: list[Path], jobs: int = 1, **options) -> list[ConversionResult]:
+    """Convert many projects, spread over a pool of worker processes.
+
+    The ``options`` are passed on to ``process_project``.
+    """
+    return list(iter_convert(project_files, jobs, **options))
+
+
+def iter_convert(
+    project_files: Iterable[Path], jobs: int = 1, **options
+) -> Iterator[ConversionResult]:
+    """Convert a stream of projects, yielding the results in order as they complete.
+
+    Projects are sent to a pool of worker processes in chunks, with a bounded number of
+    chunks in flight. Each worker reads, parses, converts, serializes and writes a project
+    before it moves on to the next one. The memory use thus stays flat however many
+    projects are converted, only the results are returned to the caller.
+
+    The ``options`` are passed on to ``process_project``.
+    """
+    project_files = iter(project_files)
+    head = list(itertools.islice(project_files, 2))
+    if jobs <= 1 or len(head) <= 1:
+        yield from _convert_prefetched(itertools.chain(head, project_files), **options)
+        return
+
+    project_files = itertools.chain(head, project_files)
+    convert_chunk = functools.partial(_convert_chunk, **options)
+    pending: collections.deque = collections.deque()
+    with futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        while chunk := list(itertools.islice(project_files, BATCH_CHUNK_SIZE)):
+            pending.append(executor.submit(convert_chunk, chunk))
+            if len(pending) >= jobs * BATCH_CHUNKS_PER_WORKER:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+@dataclass
+class Summary:
+    """Running totals of the results of a run, the results themselves are not kept."""
+
+    counts: Counter = field(default_factory=Counter)
+    profile: Profile = field(default_factory=Profile)
+
+    def add(self, result: ConversionResult) -> None:
+        """Count the result and merge its stage statistics."""
+        self.counts[result.status] += 1
+        if result.profile:
+            self.profile.merge(result.profile)
+
+
+def print_summary(results: Iterable[ConversionResult], report: IO[str] | None = None) -> Summary:
+    """Print the per file outcome as the results come in, and the totals of a batch run.
+
+    The diagnostics of each file are printed below it, and written to the ``report``.
+    """
+    summary = Summary()
+    for result in results:
+        line = f"{result.status.upper():<9} {result.source or result.path}"
+        if result.status != CONVERTED and result.message:
+            line += f": {result.message}"
+        print(line, flush=True)
+        report_diagnostics(result, report, indent="  ")
+        summary.add(result)
+    counts = summary.counts
+    print(
+        f"\n{counts.total()} files: {counts[CONVERTED]} converted, "
+        f"{counts[SKIPPED]} skipped, {counts[FAILED]} failed"
+        + "".join(f", {counts[s]} {s}" for s in (RESTORED, CHANGED, UNCHANGED) if counts[s])
+    )
+    return summary
+
+
+def report_diagnostics(
+    result: ConversionResult, report: IO[str] | None = None, indent: str = ""
+) -> None:
+    """Print the diagnostics of a result, and write them as JSON lines to the report."""
+    for diagnostic in result.diagnostics:
+        print(f"{indent}{diagnostic.message}", flush=True)
+        if report:
+            report.write(json.dumps(asdict(diagnostic)) + "\n")
+
+
+def handle_request(line: str) -> dict:
+    """Handle a JSON conversion request, returning the JSON response.
+
+    A request holds the pyproject ``text`` (or a ``path`` to read it from), optionally a
+    ``project_dir`` and an ``id`` that is copied into the response. The response holds
+    ``ok``, the converted ``output`` or an ``error``, the ``diagnostics`` (their messages
+    as ``warnings``) and the ``seconds`` it took.
+    """
+    start = time.perf_counter()
+    response: dict = {"id": None, "ok": False}
+    diagnostics: list[Diagnostic] = []
+    try:
+        request = json.loads(line)
+        response["id"] = request.get("id")
+        project_dir = request.get("project_dir")
+        if (text := request.get("text")) is None:
+            path = Path(request["path"])
+            text = path.read_text()
+            project_dir = project_dir or path.parent
+        with collect_diagnostics() as diagnostics:
+            output = convert(text, project_dir=Path(project_dir) if project_dir else None)
+        response.update(ok=True, output=output)
+    except Exception as exc:  # noqa: BLE001
+        response["error"] = f"{type(exc).__name__}: {exc}"
+    response["diagnostics"] = [asdict(diagnostic) for diagnostic in diagnostics]
+    response["warnings"] = [diagnostic.message for diagnostic in diagnostics]
+    response["seconds"] = time.perf_counter() - start
+    return response
+
+
+def serve(requests: Iterable[str], responses: IO[str]) -> None:
+    """Answer each newline delimited JSON request with a JSON response line."""
+    for line in requests:
+        if line.strip():
+            responses.write(json.dumps(handle_request(line)) + "\n")
+            responses.flush()
+
+
+def remove_socket(path: Path) -> None:
+    """Remove the Unix socket at path, refusing to remove anything else."""
+    try:
+        mode = path.lstat().st_mode
+    except FileNotFoundError:
+        return
+    if not S_ISSOCK(mode):
+        raise FileExistsError(f"{path} exists and is not a socket")
+    path.unlink(missing_ok=True)
+
+
+def socket_server(path: Path) -> socketserver.UnixStreamServer:
+    """Create the server for conversion requests on a Unix socket.
+
+    A socket left at path by an earlier server is replaced, any other file is kept.
+    """
+
+    class SocketHandler(socketserver.StreamRequestHandler):
+        """Serve the requests of one Unix socket connection."""
+
+        def handle(self) -> None:
+            """Handle the connection until the client closes it."""
+            requests = io.TextIOWrapper(self.rfile, encoding="utf-8")
+            responses = io.TextIOWrapper(self.wfile, encoding="utf-8", write_through=True)
+            serve(requests, responses)
+
+    remove_socket(path)
+    return socketserver.UnixStreamServer(str(path), SocketHandler)
+
+
+def serve_socket(path: Path) -> None:
+    """Serve conversion requests on a Unix socket, one connection at a time."""
+    with socket_server(path) as server:
+        try:
+            server.serve_forever()
+        finally:
+            remove_socket(path)
+
+
+def main() -> None:
+    """Main."""
+    args = argparser()
+    if args.socket:
+        try:
+            serve_socket(args.socket)
+        except FileExistsError as exc:
+            sys.exit(f"--socket: {exc}")
+        return
+    if args.serve:
+        serve(sys.stdin, sys.stdout)
+        return
+    if args.restore:
+        print_summary(restore_journal(args.restore))
+        return
+    options = command_options(args)
+    with contextlib.ExitStack() as stack:
+        report = stack.enter_context(args.diagnostics.open("w")) if args.diagnostics else None
+        try:
+            summary = run(args, options, report)
+        finally:
+            if args.sync == SYNC_BATCH:
+                os.sync()
+            if options.get("cache"):
+                options["cache"].evict()
+
+    if options.get("profile"):
+        report_profile(summary.profile, args.profile, args.profile_json)
+    # Differences found by --check fail the run as well.
+    if summary.counts[FAILED] or summary.counts[CHANGED]:
+        sys.exit(1)
+
+
+def command_plugins(args: argparse.Namespace) -> tuple[str, ...]:
+    """Return the transform specs of --entry-points and --plugin, in the order they run."""
+    entry_points = entry_point_specs() if args.entry_points else ()
+    return (*entry_points, *args.plugin)
+
+
+def command_options(args: argparse.Namespace) -> dict:
+    """Collect the options of the project conversions from the command line arguments."""
+    if args.check:
+        return {
+            "check": True,
+            "lock": args.lock,
+            "seed": args.seed,
+            "expected": args.expected,
+            "diff": args.diff,
+            "plugins": command_plugins(args),
+        }
+    options = {
+        "dry_run": args.n,
+        "lock": args.lock,
+        "seed": args.seed,
+        "cache": None,
+        "sync": args.sync,
+        "journal": args.journal,
+        "plugins": command_plugins(args),
+    }
+    if (args.cache or args.cache_dir) and not args.no_cache:
+        cache_dir = args.cache_dir or default_cache_dir()
+        options["cache"] = ConversionCache(cache_dir, args.cache_size * 1024 * 1024)
+    if args.profile or args.profile_json:
+        options["profile"] = True
+    return options
+
+
+def run(args: argparse.Namespace, options: dict, report: IO[str] | None = None) -> Summary:
+    """Convert the files given on the command line, writing the diagnostics to report."""
+    if args.git_ref:
+        results = []
+        for filename in args.filename:
+            results += convert_git_refs(
+                Path(filename),
+                args.git_ref,
+                options["lock"],
+                options.get("profile", False),
+                options["plugins"],
+            )
+        return print_summary(results, report)
+
+    if args.workspace:
+        root = Path(args.filename[0])
+        return print_summary(convert_workspace(root, args.jobs, **options), report)
+
+    if len(args.filename) == 1 and not (Path(args.filename[0]).is_dir() or args.changed_since):
+        # A single file keeps the original, verbose behaviour.
+        project_file = Path(args.filename[0])
+        if project_file.exists() or not glob.has_magic(args.filename[0]):
+            try:
+                result = process_project(project_file, **options)
+            except ConversionError as exc:
+                print(exc)
+                sys.exit(1)
+            report_diagnostics(result, report)
+            print(result.message)
+            summary = Summary()
+            summary.add(result)
+            return summary
+
+    # Projects stream from discovery through the workers into the report.
+    project_files = iter_projects(args.filename)
+    if args.changed_since:
+        project_files = list(project_files)
+        try:
+            changed = changed_files(args.changed_since, {p.parent for p in project_files})
+        except ConversionError as exc:
+            print(exc)
+            sys.exit(1)
+        project_files = iter(affected_projects(project_files, changed))
+    if (first := next(project_files, None)) is None:
+        print("No pyproject.toml files found")
+        return Summary()
+    project_files = itertools.chain([first], project_files)
+    return print_summary(iter_convert(project_files, args.jobs, **options), report)
+
+
+def report_profile(profile: Profile, table: bool, json_file: Path | None = None) -> None:
+    """Print the aggregated stage statistics and/or write them as JSON."""
+    if table:
+        print(f"\n{profile.table()}")
+    if json_file:
+        json_file.write_text(profile.to_json() + "\n")
 
 
 if __name__ == "__main__":
@@ -1,8 +1,11 @@
+import sys
 from pathlib import Path
 
 import pytest
 import tomlkit
 
+import convert_poetry2uv
+
 
 @pytest.fixture
 def org_toml():
@@ -87,3 +90,31 @@ def expected_project_base():
             },
         }
     }
+
+
+@pytest.fixture(autouse=True)
+def cache_home(tmp_path, monkeypatch):
+    """Keep the conversion cache of the tests out of the home directory."""
+    cache_home = tmp_path / "cache_home"
+    monkeypatch.setenv("XDG_CACHE_HOME", str(cache_home))
+    return cache_home
+
+
+@pytest.fixture
+def transform_plugin(tmp_path, monkeypatch):
+    """Make a module of transforms importable as poetry2uv_plugin."""
+    tmp_path.joinpath("poetry2uv_plugin.py").write_text(
+        "import tomlkit\n\n\n"
+        "def internal_index(new_toml, org_toml):\n"
+        "    index = tomlkit.aot()\n"
+        '    index.append({"name": "internal", "url": "https://pypi.internal/simple"})\n'
+        '    new_toml.setdefault("tool", tomlkit.table()).setdefault("uv", tomlkit.table())\n'
+        '    new_toml["tool"]["uv"]["index"] = index\n\n\n'
+        "def strip_dev(new_toml, org_toml):\n"
+        '    new_toml.get("dependency-groups", {}).pop("dev", None)\n'
+    )
+    monkeypatch.syspath_prepend(str(tmp_path))
+    convert_poetry2uv.load_transforms.cache_clear()
+    yield "poetry2uv_plugin"
+    convert_poetry2uv.load_transforms.cache_clear()
+    monkeypatch.delitem(sys.modules, "poetry2uv_plugin", raising=False)
@@ -1,4 +1,16 @@
+import io
+import json
+import os
+import resource
 import shutil
+import socket
+import stat
+import subprocess
+import sys
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 
 import pytest
 import tomlkit
@@ -9,12 +21,17 @@ import convert_poetry2uv
 @pytest.mark.parametrize(
     "key, value",
     [
-        ("^3.6", ">=3.6"),
+        ("^3.6", ">=3.6,<4"),
         ("*", ""),
-        ("^1.2.3", ">=1.2.3"),
-        ("~1.2.3", ">=1.2.3"),
-        ("~1.*", ">=1"),
-        ("~1.2.*", ">=1.2"),
+        ("^1.2.3", ">=1.2.3,<2"),
+        ("^0.2.3", ">=0.2.3,<0.3"),
+        ("^0.0.3", ">=0.0.3,<0.0.4"),
+        ("^0.0", ">=0.0,<0.1"),
+        ("~1.2.3", ">=1.2.3,<1.3"),
+        ("~1", ">=1,<2"),
+        ("~1.*", "==1.*"),
+        ("~1.2.*", "==1.2.*"),
+        ("~=1.2", "~=1.2"),
         (">= 1.2 < 1.5", ">=1.2,<1.5"),
         (">= 1.2.0  < 1.3.0", ">=1.2.0,<1.3.0"),
         (">= 1.2 < 1.5 == 1.4", ">=1.2,<1.5,==1.4"),
@@ -22,12 +39,61 @@ import convert_poetry2uv
         (">= 1.8.4, <3.0.0, != 2.8.*", ">=1.8.4,<3.0.0,!=2.8.*"),
         (">=12.0.0", ">=12.0.0"),
         ("2.4.10", "==2.4.10"),
+        ("^1.0 || ^2.0", ">=1,<3"),
+        ("^1.0 || ^3.0", ">=1,<4,!=2.*"),
+        ("<1.5 || >1.5", "!=1.5"),
     ],
 )
 def test_version_conversion(key, value):
     assert convert_poetry2uv.version_conversion(key) == value
 
 
+def test_version_conversion_without_upper_bounds():
+    assert convert_poetry2uv.version_conversion("^3.12", upper_bounds=False) == ">=3.12"
+    assert convert_poetry2uv.version_conversion(">=3.9,<3.13", upper_bounds=False) == (
+        ">=3.9,<3.13"
+    )
+
+
+@pytest.mark.parametrize(
+    "poetry, pep440, equivalent",
+    [
+        ["^1.2", ">=1.2,<2", True],
+        ["^1.2", ">=1.2", False],
+        ["~1.2.3", ">=1.2.3,<1.3.0", True],
+        ["1.2.*", ">=1.2,<1.3", True],
+        ["^1.0 || ^3.0", ">=1,<4,!=2.*", True],
+        [">=1,<1.2 || >=1.4", ">=1", False],
+        ["*", "", True],
+    ],
+)
+def test_version_set(poetry, pep440, equivalent):
+    versions = convert_poetry2uv.version_set(poetry)
+    assert (versions == convert_poetry2uv.version_set(pep440 or "*")) is equivalent
+
+
+def test_check_equivalence(capsys, pyproject_empty_base):
+    org = tomlkit.loads(
+        '[tool.poetry.dependencies]\nfoo = "^1.2"\nbar = "^2"\n'
+        '[tool.poetry.group.dev.dependencies]\nbaz = ">=1,<1.2 || >=1.4"\n'
+    )
+    pyproject_empty_base["project"]["dependencies"] = ["foo>=1.2,<2", "bar>=2"]
+    pyproject_empty_base["dependency-groups"] = {"dev": ["baz>=1"]}
+    convert_poetry2uv.check_equivalence(pyproject_empty_base, org)
+    out = capsys.readouterr().out
+    assert "'foo'" not in out
+    assert "The conversion of 'bar' is not equivalent: '^2' became '>=2'" in out
+    assert "The conversion of 'baz' is not equivalent" in out
+
+
+def test_version_conversion_cached():
+    convert_poetry2uv.translate_constraint.cache_clear()
+    for _ in range(3):
+        assert convert_poetry2uv.version_conversion(tomlkit.string("^1.2")) == ">=1.2,<2"
+    info = convert_poetry2uv.translate_constraint.cache_info()
+    assert (info.hits, info.misses) == (2, 1)
+
+
 @pytest.mark.parametrize(
     "key, value, expected",
     [
@@ -169,8 +235,47 @@ def test_no_python_in_deps(org_toml):
     assert "python" not in uv_deps
 
 
+def test_dependency_model(pyproject_empty_base):
+    in_txt = """
+    [tool.poetry.dependencies]
+    python = "^3.12"
+    jira = {version = "^3.8.0", optional = true}
+    requests = {version = "^2.13.0", source = "private"}
+
+    [tool.poetry.group.dev.dependencies]
+    mypy = "^1.0.1"
+    httpx = {version = "^1.0", optional = true}
+
+    [tool.poetry.dev-dependencies]
+    black = "*"
+
+    [tool.poetry.extras]
+    JIRA = ["jira"]
+    HTTP = ["httpx"]
+
+    [[tool.poetry.source]]
+    name = "private"
+    url = "http://example.com/simple"
+    """
+    model = convert_poetry2uv.DependencyModel.from_poetry(tomlkit.loads(in_txt))
+    assert model.dependencies == ["requests>=2.13.0,<3"]
+    assert model.groups == {"dev": ["mypy>=1.0.1,<2", "black"]}
+    assert model.optional == {"jira": ">=3.8.0,<4", "httpx": ">=1.0,<2"}
+    assert model.sources == {"requests": {"index": "private"}}
+
+    model.emit(pyproject_empty_base)
+    assert pyproject_empty_base == {
+        "project": {
+            "dependencies": ["requests>=2.13.0,<3"],
+            "optional-dependencies": {"JIRA": ["jira>=3.8.0,<4"], "HTTP": ["httpx>=1.0,<2"]},
+        },
+        "dependency-groups": {"dev": ["mypy>=1.0.1,<2", "black"]},
+        "tool": {"uv": {"sources": {"requests": {"index": "private"}}}},
+    }
+
+
 def test_dependencies(pyproject_empty_base, org_toml):
-    expected = {"project": {"dependencies": ["pytest", "pytest-cov", "jira>=3.8.0"]}}
+    expected = {"project": {"dependencies": ["pytest", "pytest-cov", "jira>=3.8.0,<4"]}}
     convert_poetry2uv.dependencies(pyproject_empty_base, org_toml)
     assert pyproject_empty_base == expected
 
@@ -179,7 +284,7 @@ def test_optional_dependencies(pyproject_empty_base, org_toml_optional):
     expected = {
         "project": {
             "dependencies": ["pytest", "pytest-cov"],
-            "optional-dependencies": {"JIRA": ["jira>=3.8.0"]},
+            "optional-dependencies": {"JIRA": ["jira>=3.8.0,<4"]},
         }
     }
     convert_poetry2uv.dependencies(pyproject_empty_base, org_toml_optional)
@@ -198,14 +303,26 @@ def test_extras_dependencies():
     deps = in_dict["tool"]["poetry"]["dependencies"]
     expected = [
         "pytest",
-        "pandas[computation]>=2.2.1",
-        "pandas[performance]>=2.2.1",
-        "fastapi[all]>=0.92.0",
+        "pandas[computation,performance]>=2.2.1,<3",
+        "fastapi[all]>=0.92.0,<0.93",
     ]
     uv_deps, _, _, _ = convert_poetry2uv.parse_packages(deps)
     assert uv_deps == expected
 
 
+@pytest.mark.parametrize(
+    "requirements, expected",
+    [
+        [["pandas[b]>=2", "pandas[a]>=2"], ["pandas[a,b]>=2"]],
+        [["Pandas>=2", "pandas[a] >= 2", "pandas<3"], ["Pandas[a]>=2", "pandas<3"]],
+        [["foo", "foo", "bar[x,x]"], ["foo", "bar[x]"]],
+        [["foo; python_version < '3.11'", "foo"], ["foo; python_version < '3.11'", "foo"]],
+    ],
+)
+def test_merge_requirements(requirements, expected):
+    assert convert_poetry2uv.merge_requirements(requirements) == expected
+
+
 @pytest.mark.parametrize(
     "develop_flag",
     [
@@ -256,7 +373,7 @@ def test_add_tool_uv_sources(pyproject_empty_base):
 def test_dev_dependencies(pyproject_empty_base, org_toml):
     expected = {
         "project": {},
-        "dependency-groups": {"dev": ["mypy>=1.0.1"]},
+        "dependency-groups": {"dev": ["mypy>=1.0.1,<2"]},
     }
     convert_poetry2uv.group_dependencies(pyproject_empty_base, org_toml)
     assert pyproject_empty_base == expected
@@ -313,8 +430,8 @@ def test_dev_dependencies_optional(pyproject_empty_base):
     }
     convert_poetry2uv.group_dependencies(pyproject_empty_base, in_dict)
     expected = {
-        "project": {"optional-dependencies": {"JIRA": ["jira>=3.8.0"]}},
-        "dependency-groups": {"dev": ["mypy>=1.0.1"]},
+        "project": {"optional-dependencies": {"JIRA": ["jira>=3.8.0,<4"]}},
+        "dependency-groups": {"dev": ["mypy>=1.0.1,<2"]},
     }
     assert pyproject_empty_base == expected
 
@@ -330,7 +447,7 @@ def test_dev_extras_dependencies(pyproject_empty_base):
     """
     in_dict = tomlkit.loads(in_txt)
     convert_poetry2uv.group_dependencies(pyproject_empty_base, in_dict)
-    expected = {"project": {}, "dependency-groups": {"dev": ["fastapi[all]>=0.92.0"]}}
+    expected = {"project": {}, "dependency-groups": {"dev": ["fastapi[all]>=0.92.0,<0.93"]}}
     assert pyproject_empty_base == expected
 
 
@@ -346,7 +463,7 @@ def test_doc_dependencies(pyproject_empty_base, org_toml):
     org_toml["tool"]["poetry"]["group"]["doc"] = {"dependencies": {"mkdocs": "*"}}
     expected = {
         "project": {},
-        "dependency-groups": {"dev": ["mypy>=1.0.1"], "doc": ["mkdocs"]},
+        "dependency-groups": {"dev": ["mypy>=1.0.1,<2"], "doc": ["mkdocs"]},
     }
     convert_poetry2uv.group_dependencies(pyproject_empty_base, org_toml)
     assert pyproject_empty_base == expected
@@ -402,6 +519,55 @@ def test_build_system(input, expected):
     assert got == expected
 
 
+VERBATIM_TOOLS = """[tool.ruff]
+line-length   =   100  # odd spacing is kept
+
+[tool.ruff.lint]
+select = ["E"]
+"""
+
+
+def test_split_verbatim():
+    text = (
+        '[tool.poetry]\nname = "x"\nversion = "1"\n\n'
+        + VERBATIM_TOOLS
+        + '[tool.poetry.dependencies]\nfoo = "^1"\n\n'
+        '[build-system]\nrequires = ["hatchling"]\nbuild-backend = "hatchling.build"\n'
+    )
+    rest, verbatim = convert_poetry2uv.split_verbatim(text)
+    assert verbatim == VERBATIM_TOOLS + text[text.index("[build-system]") :]
+    assert rest == text[: text.index("[tool.ruff]")] + '[tool.poetry.dependencies]\nfoo = "^1"\n\n'
+
+    output = convert_poetry2uv.convert(text)
+    assert output.endswith("\n\n" + VERBATIM_TOOLS + text[text.index("[build-system]") :])
+    assert tomlkit.loads(output)["project"]["dependencies"] == ["foo>=1,<2"]
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        '[tool]\nruff.line-length = 100\n[tool.poetry]\nname = "x"\n',
+        'tool.ruff.line-length = 100\n[tool.poetry]\nname = "x"\n',
+        '[tool.poetry]\ndescription = """\n[tool.ruff]\n"""\n',
+        '[tool."ruff"]\nline-length = 100\n[tool.poetry]\nname = "x"\n',
+    ],
+)
+def test_split_verbatim_unsafe(text):
+    assert convert_poetry2uv.split_verbatim(text) == (text, "")
+
+
+def test_convert_existing_tool_uv():
+    text = (
+        '[tool.poetry]\nname = "x"\nversion = "1"\n\n[tool.poetry.dependencies]\n'
+        'foo = { path = "../foo" }\n\n[tool.uv]\npackage = false\n\n'
+        '[tool.uv.sources]\nbar = { index = "internal" }\n\n[tool.ruff]\nline-length = 100\n'
+    )
+    assert convert_poetry2uv.split_verbatim(text)[1] == "[tool.ruff]\nline-length = 100\n"
+    uv = tomlkit.loads(convert_poetry2uv.convert(text))["tool"]["uv"]
+    assert uv["package"] is False
+    assert uv["sources"] == {"foo": {"path": "../foo"}, "bar": {"index": "internal"}}
+
+
 def test_poetry_sources(pyproject_empty_base):
     in_txt = """
     [tool.poetry.dependencies]
@@ -415,8 +581,8 @@ def test_poetry_sources(pyproject_empty_base):
     in_dict = tomlkit.loads(in_txt)
     convert_poetry2uv.dependencies(pyproject_empty_base, in_dict)
     expected = {
-        "project": {"dependencies": ["requests>=2.13.0"]},
-        "tool": {"uv": {"sources": {"requests": {"git": "http://example.com/simple"}}}},
+        "project": {"dependencies": ["requests>=2.13.0,<3"]},
+        "tool": {"uv": {"sources": {"requests": {"index": "private"}}}},
     }
     assert pyproject_empty_base == expected
 
@@ -441,12 +607,12 @@ def test_normal_and_dev_poetry_sources(pyproject_empty_base):
     convert_poetry2uv.group_dependencies(pyproject_empty_base, in_dict)
     expected = {
         "project": {},
-        "dependency-groups": {"dev": ["requests>=2.13.0"], "doc": ["httpx>=1.13.0"]},
+        "dependency-groups": {"dev": ["requests>=2.13.0,<3"], "doc": ["httpx>=1.13.0,<2"]},
         "tool": {
             "uv": {
                 "sources": {
-                    "requests": {"git": "http://example.com/simple"},
-                    "httpx": {"git": "http://other.com/simple"},
+                    "requests": {"index": "private"},
+                    "httpx": {"index": "other"},
                 }
             }
         },
@@ -454,6 +620,147 @@ def test_normal_and_dev_poetry_sources(pyproject_empty_base):
     assert pyproject_empty_base == expected
 
 
+def test_poetry_sources_primary_replaces_pypi(pyproject_empty_base):
+    in_txt = """
+    [[tool.poetry.source]]
+    name = "first"
+    url = "http://first.com/simple"
+    priority = "primary"
+
+    [[tool.poetry.source]]
+    name = "second"
+    url = "http://second.com/simple"
+
+    [[tool.poetry.source]]
+    name = "extra"
+    url = "http://extra.com/simple"
+    priority = "supplemental"
+    """
+    with convert_poetry2uv.collect_diagnostics() as diagnostics:
+        convert_poetry2uv.poetry_sources(pyproject_empty_base, tomlkit.loads(in_txt))
+    indexes = pyproject_empty_base["tool"]["uv"]["index"].unwrap()
+    # uv searches a default index last, the supplemental one would outrank it.
+    assert indexes == [
+        {"name": "first", "url": "http://first.com/simple"},
+        {"name": "second", "url": "http://second.com/simple"},
+        {"name": "extra", "url": "http://extra.com/simple"},
+    ]
+    assert [d.code for d in diagnostics] == ["pypi-fallback"]
+
+
+def test_poetry_sources_default_index(pyproject_empty_base):
+    in_txt = """
+    [[tool.poetry.source]]
+    name = "first"
+    url = "http://first.com/simple"
+    priority = "primary"
+
+    [[tool.poetry.source]]
+    name = "main"
+    url = "http://main.com/simple"
+    priority = "default"
+
+    [[tool.poetry.source]]
+    name = "second"
+    url = "http://second.com/simple"
+    """
+    convert_poetry2uv.poetry_sources(pyproject_empty_base, tomlkit.loads(in_txt))
+    indexes = pyproject_empty_base["tool"]["uv"]["index"].unwrap()
+    assert indexes == [
+        {"name": "main", "url": "http://main.com/simple"},
+        {"name": "first", "url": "http://first.com/simple"},
+        {"name": "second", "url": "http://second.com/simple", "default": True},
+    ]
+
+
+def test_poetry_sources_pypi_pin(pyproject_empty_base):
+    in_txt = """
+    [tool.poetry.dependencies]
+    requests = { version = "^2.13.0", source = "PyPI" }
+
+    [[tool.poetry.source]]
+    name = "PyPI"
+    priority = "primary"
+    """
+    org_toml = tomlkit.loads(in_txt)
+    convert_poetry2uv.dependencies(pyproject_empty_base, org_toml)
+    convert_poetry2uv.poetry_sources(pyproject_empty_base, org_toml)
+    uv = pyproject_empty_base["tool"]["uv"].unwrap()
+    assert uv["sources"] == {"requests": {"index": "PyPI"}}
+    assert uv["index"] == [{"name": "PyPI", "url": "https://pypi.org/simple"}]
+
+
+def test_poetry_sources_to_index(pyproject_empty_base):
+    in_txt = """
+    [[tool.poetry.source]]
+    name = "PyPI"
+    priority = "primary"
+
+    [[tool.poetry.source]]
+    name = "extra"
+    url = "http://extra.com/simple"
+    priority = "supplemental"
+
+    [[tool.poetry.source]]
+    name = "private"
+    url = "http://example.com/simple"
+    priority = "explicit"
+
+    [[tool.poetry.source]]
+    name = "mirror"
+    url = "http://mirror.com/simple"
+    priority = "default"
+
+    [[tool.poetry.source]]
+    name = "internal"
+    url = "http://internal.com/simple"
+    """
+    in_dict = tomlkit.loads(in_txt)
+    convert_poetry2uv.poetry_sources(pyproject_empty_base, in_dict)
+    expected = """[project]
+
+[[tool.uv.index]]
+name = "mirror"
+url = "http://mirror.com/simple"
+
+[[tool.uv.index]]
+name = "PyPI"
+url = "https://pypi.org/simple"
+
+[[tool.uv.index]]
+name = "private"
+url = "http://example.com/simple"
+explicit = true
+
+[[tool.uv.index]]
+name = "internal"
+url = "http://internal.com/simple"
+
+[[tool.uv.index]]
+name = "extra"
+url = "http://extra.com/simple"
+"""
+    assert pyproject_empty_base.unwrap() == tomlkit.loads(expected).unwrap()
+
+
+def test_poetry_sources_keep_tool_section(pyproject_empty_base):
+    in_txt = """
+    [tool.poetry.dependencies]
+    requests = { version = "^2.13.0", source = "private" }
+    some-plugin = {path = "plugins/some_plugin"}
+
+    [[tool.poetry.source]]
+    name = "private"
+    url = "http://example.com/simple"
+    """
+    in_dict = tomlkit.loads(in_txt)
+    convert_poetry2uv.dependencies(pyproject_empty_base, in_dict)
+    assert pyproject_empty_base["tool"]["uv"]["sources"] == {
+        "requests": {"index": "private"},
+        "some-plugin": {"path": "plugins/some_plugin"},
+    }
+
+
 def test_project_base(toml_obj, pyproject_empty_base, expected_project_base):
     org_toml = toml_obj("tests/files/poetry_pyproject.toml")
     new_toml = pyproject_empty_base
@@ -482,10 +789,56 @@ def test_argparser(mocker):
         ["convert_poetry2uv.py", "tests/files/poetry_pyproject.toml", "-n"],
     )
     sys_argv = convert_poetry2uv.argparser()
-    assert sys_argv.filename == "tests/files/poetry_pyproject.toml"
+    assert sys_argv.filename == ["tests/files/poetry_pyproject.toml"]
     assert sys_argv.n is True
 
 
+def test_argparser_version(mocker, capsys):
+    mocker.patch("sys.argv", ["convert_poetry2uv.py", "--version"])
+    with pytest.raises(SystemExit) as exc:
+        convert_poetry2uv.argparser()
+    assert exc.value.code == 0
+    assert capsys.readouterr().out == f"convert_poetry2uv {convert_poetry2uv.__version__}\n"
+
+
+# Cumulative import time of the module in microseconds, compiling included.
+IMPORT_TIME_BUDGET = 150_000
+
+
+def import_times(*args):
+    cmd = [sys.executable, "-X", "importtime", *args]
+    stderr = subprocess.run(cmd, check=True, capture_output=True, text=True).stderr  # noqa: S603
+    times = {}
+    for line in stderr.splitlines()[1:]:
+        _, cumulative, module = line.split("|")
+        times[module.strip()] = int(cumulative)
+    return times
+
+
+def test_import_time_budget():
+    times = import_times("-c", "import convert_poetry2uv")
+    assert times["convert_poetry2uv"] < IMPORT_TIME_BUDGET
+    assert not {"tomlkit", "socketserver"} & times.keys()
+
+
+def test_lazy_import_missing():
+    with pytest.raises(ModuleNotFoundError, match="no_such_module"):
+        convert_poetry2uv.lazy_import("no_such_module")
+
+
+@pytest.mark.parametrize("option", ["--help", "--version"])
+def test_fast_paths_skip_tomlkit(option):
+    assert "tomlkit" not in import_times("convert_poetry2uv.py", option)
+
+
+def test_conversion_skips_entry_points(tmp_path):
+    shutil.copy("tests/files/poetry_pyproject.toml", tmp_path / "pyproject.toml")
+    times = import_times("convert_poetry2uv.py", str(tmp_path / "pyproject.toml"), "-n")
+    assert "tomlkit.items" in times
+    # Looking up the installed entry points is left to --entry-points.
+    assert not [module for module in times if module.startswith("importlib.metadata")]
+
+
 def test_plugins(pyproject_empty_base):
     in_txt = """
     [tool.poetry.plugins."spam.magical"]
@@ -548,3 +901,896 @@ def test_main_different_files(mocker, tmp_path, toml_obj, in_path, expected_path
     got = toml_obj(filename)
     expected = toml_obj(expected_path)
     assert got == expected
+
+
+def test_discover_projects(tmp_path):
+    for sub in ("a", "b/c", ".venv/lib", "d"):
+        tmp_path.joinpath(sub).mkdir(parents=True)
+    for sub in ("a", "b/c", ".venv/lib"):
+        tmp_path.joinpath(sub, "pyproject.toml").touch()
+    got = convert_poetry2uv.discover_projects([str(tmp_path), str(tmp_path / "a/pyproject.toml")])
+    assert got == [tmp_path / "a/pyproject.toml", tmp_path / "b/c/pyproject.toml"]
+    got = convert_poetry2uv.discover_projects([str(tmp_path / "*" / "pyproject.toml")])
+    assert got == [tmp_path / "a/pyproject.toml"]
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_convert_batch(tmp_path, toml_obj, jobs):
+    for name in ("one", "two"):
+        tmp_path.joinpath(name).mkdir()
+        shutil.copy("tests/files/poetry_pyproject.toml", tmp_path / name / "pyproject.toml")
+    tmp_path.joinpath("uv").mkdir()
+    shutil.copy("tests/files/poetry_pyproject_converted.toml", tmp_path / "uv/pyproject.toml")
+    tmp_path.joinpath("broken").mkdir()
+    tmp_path.joinpath("broken/pyproject.toml").write_text("[tool.poetry]\n")
+
+    files = convert_poetry2uv.discover_projects([str(tmp_path)])
+    results = convert_poetry2uv.convert_batch(files, dry_run=True, jobs=jobs)
+
+    statuses = {r.path.parent.name: r.status for r in results}
+    assert statuses == {"broken": "failed", "one": "converted", "two": "converted", "uv": "skipped"}
+    expected = toml_obj("tests/files/poetry_pyproject_converted.toml")
+    assert toml_obj(tmp_path / "one/pyproject_temp_uv.toml") == expected
+
+
+def test_main_batch(mocker, tmp_path, capsys):
+    tmp_path.joinpath("one").mkdir()
+    shutil.copy("tests/files/poetry_pyproject.toml", tmp_path / "one/pyproject.toml")
+    mocker.patch("sys.argv", ["convert_poetry2uv.py", str(tmp_path), "-n", "-j", "1"])
+    convert_poetry2uv.main()
+    out = capsys.readouterr().out
+    assert f"CONVERTED {tmp_path / 'one/pyproject.toml'}" in out
+    assert "1 files: 1 converted, 0 skipped, 0 failed" in out
+
+
+def test_diagnostics():
+    content = b"""
+    [tool.poetry]
+    name = "x"
+    version = "1"
+    authors = [1]
+
+    [tool.poetry.dependencies]
+    foo = "latest"
+    bar = {version = "^1", source = "missing"}
+
+    [tool.poetry.group."my docs".dependencies]
+    baz = ">=1,<1.2 || >=1.4"
+
+    [build-system]
+    build-backend = "poetry.core.masonry.api"
+    """
+    converted = convert_poetry2uv.convert_content(
+        content, convert_poetry2uv.ProjectFiles(None), False
+    )
+    diagnostics = convert_poetry2uv.converted_diagnostics(converted, "pyproject.toml")
+    assert [(d.code, d.severity, d.toml_path) for d in diagnostics] == [
+        ("invalid-author", "warning", "tool.poetry.authors"),
+        ("invalid-version", "warning", "tool.poetry.dependencies.foo"),
+        ("unknown-source", "warning", "tool.poetry.dependencies.bar.source"),
+        ("build-system-removed", "info", "build-system"),
+        ("not-equivalent", "warning", 'tool.poetry.group."my docs".dependencies.baz'),
+    ]
+    assert {d.file for d in diagnostics} == {"pyproject.toml"}
+
+
+def test_main_batch_diagnostics(mocker, tmp_path, capsys):
+    for name in ("one", "two"):
+        tmp_path.joinpath(name).mkdir()
+        shutil.copy("tests/files/poetry_pyproject.toml", tmp_path / name / "pyproject.toml")
+    report = tmp_path / "diagnostics.jsonl"
+    argv = ["convert_poetry2uv.py", str(tmp_path), "-n", "-j", "2", "--diagnostics", str(report)]
+    mocker.patch("sys.argv", argv)
+    convert_poetry2uv.main()
+    out = capsys.readouterr().out
+    first = str(tmp_path / "one/pyproject.toml")
+    assert f"CONVERTED {first}\n  Poetry build system detected. It will be removed.\n" in out
+
+    diagnostics = [json.loads(line) for line in report.read_text().splitlines()]
+    assert [(d["file"], d["code"]) for d in diagnostics] == [
+        (first, "build-system-removed"),
+        (str(tmp_path / "two/pyproject.toml"), "build-system-removed"),
+    ]
+
+
+@pytest.mark.parametrize(
+    "requirement, expected",
+    [
+        ["pytest", {"name": "pytest"}],
+        ["jira>=3.8.0", {"name": "jira", "specifier": ">=3.8.0"}],
+        ["jira (>=3.8.0,<4.0.0)", {"name": "jira", "specifier": ">=3.8.0,<4.0.0"}],
+        [
+            "Pandas[computation, performance]>=2.2.1; python_version >= '3.12'",
+            {
+                "name": "pandas",
+                "extra": ["computation", "performance"],
+                "specifier": ">=2.2.1",
+                "marker": "python_version >= '3.12'",
+            },
+        ],
+    ],
+)
+def test_parse_requirement(requirement, expected):
+    assert convert_poetry2uv.parse_requirement(requirement) == expected
+
+
+def test_iter_poetry_lock():
+    with open("tests/files/lock_poetry.lock") as fh:
+        sections = list(convert_poetry2uv.iter_poetry_lock(fh))
+    assert [s for s, _ in sections] == ["package"] * 4 + ["metadata"]
+    assert sections[3][1]["extras"]["socks"] == ["PySocks (>=1.5.6,!=1.5.7)"]
+    assert sections[4][1]["lock-version"] == "2.1"
+
+
+def test_convert_lock(tmp_path):
+    shutil.copy("tests/files/lock_pyproject.toml", tmp_path / "pyproject.toml")
+    shutil.copy("tests/files/lock_poetry.lock", tmp_path / "poetry.lock")
+    result = convert_poetry2uv.convert_project(tmp_path / "pyproject.toml", lock=True)
+    assert f"Converted {tmp_path / 'poetry.lock'}" in result.message
+
+    uv_lock = convert_poetry2uv.toml_loads(tmp_path.joinpath("uv.lock").read_text())
+    packages = {p["name"]: p for p in uv_lock["package"]}
+    assert list(packages) == ["certifi", "colorama", "idna", "lock-project", "requests"]
+    assert uv_lock["requires-python"] == ">=3.12"
+    # Dependencies missing from the lock and optional ones are left out.
+    assert packages["requests"]["dependencies"] == [{"name": "certifi"}, {"name": "idna"}]
+    assert packages["requests"]["version"] == "2.32.3"
+    assert packages["requests"]["wheels"][0]["url"].endswith("requests-2.32.3-py3-none-any.whl")
+    assert packages["lock-project"]["metadata"] == {
+        "requires-dist": [{"name": "requests", "specifier": ">=2.31.0,<3"}],
+        "requires-dev": {"dev": [{"name": "colorama"}]},
+    }
+
+
+def test_convert_lock_build_system(tmp_path):
+    text = Path("tests/files/lock_pyproject.toml").read_text()
+    text = text.replace("poetry-core>=1.0.0", "hatchling").replace(
+        "poetry.core.masonry.api", "hatchling.build"
+    )
+    tmp_path.joinpath("pyproject.toml").write_text(text)
+    shutil.copy("tests/files/lock_poetry.lock", tmp_path / "poetry.lock")
+    convert_poetry2uv.convert_project(tmp_path / "pyproject.toml", lock=True)
+
+    uv_lock = convert_poetry2uv.toml_loads(tmp_path.joinpath("uv.lock").read_text())
+    project = next(p for p in uv_lock["package"] if p["name"] == "lock-project")
+    assert project["source"] == {"editable": "."}
+    assert 'build-backend = "hatchling.build"' in tmp_path.joinpath("pyproject.toml").read_text()
+
+
+def test_convert_lock_forked(tmp_path):
+    shutil.copy("tests/files/lock_pyproject.toml", tmp_path / "pyproject.toml")
+    shutil.copy("tests/files/forked_poetry.lock", tmp_path / "poetry.lock")
+    result = convert_poetry2uv.convert_project(tmp_path / "pyproject.toml", lock=True)
+    assert "locks several versions of a package, uv.lock not created" in result.message
+    assert "forked-lock" in [d.code for d in result.diagnostics]
+    assert not tmp_path.joinpath("uv.lock").exists()
+
+
+def test_convert_lock_outdated(tmp_path):
+    shutil.copy("tests/files/lock_pyproject.toml", tmp_path / "pyproject.toml")
+    shutil.copy("tests/files/lock_poetry.lock", tmp_path / "poetry.lock")
+    with tmp_path.joinpath("pyproject.toml").open("a") as fh:
+        fh.write('\n[tool.poetry.group.doc.dependencies]\nmkdocs = "*"\n')
+    result = convert_poetry2uv.convert_project(tmp_path / "pyproject.toml", lock=True)
+    assert "is out of date with pyproject.toml" in result.message
+    assert not tmp_path.joinpath("uv.lock").exists()
+
+
+@pytest.mark.parametrize(
+    "file_path, expected",
+    [
+        ["tests/files/poetry_pyproject.toml", convert_poetry2uv.POETRY_V1],
+        ["tests/files/v2_poetry_pyproject.toml", convert_poetry2uv.POETRY_V2],
+        ["tests/files/poetry_pyproject_converted.toml", convert_poetry2uv.ALREADY_CONVERTED],
+        ["tests/files/editable_sources_converted.toml", convert_poetry2uv.ALREADY_CONVERTED],
+        ["pyproject.toml", convert_poetry2uv.ALREADY_CONVERTED],
+    ],
+)
+def test_classify_project(file_path, expected):
+    assert convert_poetry2uv.classify_project(Path(file_path).read_bytes()) == expected
+    assert convert_poetry2uv.scan_project_kind(Path(file_path).read_bytes()) == expected
+
+
+def test_classify_project_without_tomllib(mocker):
+    mocker.patch.object(convert_poetry2uv, "tomllib", None)
+    loads = mocker.spy(convert_poetry2uv.tk, "loads")
+    content = Path("tests/files/v2_poetry_pyproject.toml").read_bytes()
+    assert convert_poetry2uv.classify_project(content) == convert_poetry2uv.POETRY_V2
+    loads.assert_not_called()
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        b'[project]\nname = "hatch-project"\n\n[build-system]\nbuild-backend = "hatchling.build"\n',
+        b'[project]\nname = "keyword"\nkeywords = ["poetry"]\n',
+    ],
+)
+def test_classify_project_not_poetry(content):
+    assert convert_poetry2uv.classify_project(content) == convert_poetry2uv.NOT_POETRY
+    assert convert_poetry2uv.scan_project_kind(content) == convert_poetry2uv.NOT_POETRY
+
+
+def test_main_already_converted(mocker, tmp_path, capsys):
+    filename = tmp_path.joinpath("pyproject.toml")
+    shutil.copy("tests/files/poetry_pyproject_converted.toml", filename)
+    mocker.patch("sys.argv", ["convert_poetry2uv.py", str(filename)])
+    convert_poetry2uv.main()
+    assert capsys.readouterr().out == "Already converted to uv, nothing to do\n"
+    assert not tmp_path.joinpath("pyproject.toml.org").exists()
+
+
+def test_conversion_cache_hit(mocker, tmp_path, toml_obj):
+    filename = tmp_path.joinpath("project", "pyproject.toml")
+    filename.parent.mkdir()
+    shutil.copy("tests/files/poetry_pyproject.toml", filename)
+    cache = convert_poetry2uv.ConversionCache(tmp_path / "cache")
+
+    convert_poetry2uv.convert_project(filename, dry_run=True, cache=cache)
+    filename.parent.joinpath("pyproject_temp_uv.toml").unlink()
+    spy = mocker.spy(convert_poetry2uv, "convert_content")
+    convert_poetry2uv.convert_project(filename, dry_run=True, cache=cache)
+
+    spy.assert_not_called()
+    got = toml_obj(filename.parent.joinpath("pyproject_temp_uv.toml"))
+    assert got == toml_obj("tests/files/poetry_pyproject_converted.toml")
+
+
+def test_conversion_cache_hit_diagnostics(mocker, tmp_path):
+    filename = tmp_path / "pyproject.toml"
+    filename.write_text(
+        '[tool.poetry]\nname = "x"\nversion = "1"\n\n[tool.poetry.dependencies]\nfoo = "latest"\n'
+        '\n[build-system]\nbuild-backend = "poetry.core.masonry.api"\n'
+    )
+    cache = convert_poetry2uv.ConversionCache(tmp_path / "cache")
+    first = convert_poetry2uv.convert_project(filename, dry_run=True, cache=cache).diagnostics
+    assert [d.code for d in first] == ["invalid-version", "build-system-removed"]
+
+    spy = mocker.spy(convert_poetry2uv, "convert_content")
+    result = convert_poetry2uv.convert_project(filename, dry_run=True, cache=cache)
+    spy.assert_not_called()
+    assert result.diagnostics == first
+
+
+def test_conversion_cache_other_directory(tmp_path):
+    cache = convert_poetry2uv.ConversionCache(tmp_path / "cache")
+    for name in ("c", "d"):
+        tmp_path.joinpath(name).mkdir()
+        shutil.copy("tests/files/lock_pyproject.toml", tmp_path / name / "pyproject.toml")
+        shutil.copy("tests/files/lock_poetry.lock", tmp_path / name / "poetry.lock")
+    convert_poetry2uv.convert_project(
+        tmp_path / "c/pyproject.toml", dry_run=True, lock=True, cache=cache
+    )
+    result = convert_poetry2uv.convert_project(
+        tmp_path / "d/pyproject.toml", lock=True, cache=cache
+    )
+    assert f"Converted {tmp_path / 'd/poetry.lock'} into uv.lock" in result.message
+
+
+def test_conversion_cache_key(tmp_path):
+    content = b'[tool.poetry]\nname = "x"\nlicense = "LICENSE"\n'
+    cache = convert_poetry2uv.ConversionCache(tmp_path / "cache")
+    key = cache.key(content, tmp_path, lock=False)
+    assert key == cache.key(content, tmp_path, lock=False)
+    assert key != cache.key(content, tmp_path, lock=True)
+    tmp_path.joinpath("LICENSE").touch()
+    assert key != cache.key(content, tmp_path, lock=False)
+
+
+def test_conversion_cache_evict(tmp_path):
+    cache = convert_poetry2uv.ConversionCache(tmp_path / "cache", max_size=250)
+    for i in range(5):
+        cache.put(f"key{i}", {"pyproject": "x" * 100})
+        os.utime(cache.directory / f"key{i}.json", (i, i))
+    cache.get("key0")
+    cache.evict()
+    assert sorted(p.name for p in cache.directory.iterdir()) == ["key0.json", "key4.json"]
+
+
+def test_main_no_cache(mocker, tmp_path, cache_home):
+    filename = tmp_path.joinpath("pyproject.toml")
+    shutil.copy("tests/files/poetry_pyproject.toml", filename)
+    for options in ([], ["--cache", "--no-cache"]):
+        mocker.patch("sys.argv", ["convert_poetry2uv.py", str(filename), "-n", *options])
+        convert_poetry2uv.main()
+        assert not cache_home.exists()
+    mocker.patch("sys.argv", ["convert_poetry2uv.py", str(filename), "-n", "--cache"])
+    convert_poetry2uv.main()
+    assert len(list(cache_home.joinpath("convert_poetry2uv").glob("*.json"))) == 1
+
+
+def test_convert_project_profile(tmp_path):
+    filename = tmp_path.joinpath("pyproject.toml")
+    shutil.copy("tests/files/poetry_pyproject.toml", filename)
+    result = convert_poetry2uv.convert_project(filename, dry_run=True, profile=True)
+    assert list(result.profile) == [
+        "parse",
+        "project_base",
+        "project_license",
+        "authors_maintainers",
+        "dependency_model",
+        "emit_dependencies",
+        "poetry_plugins",
+        "poetry_sources",
+        "build_system",
+        "tools",
+        "equivalence",
+        "serialization",
+    ]
+    assert all(stats.calls == 1 for stats in result.profile.values())
+    assert result.profile["parse"].peak_memory > 0
+
+
+def test_main_profile(mocker, tmp_path, capsys):
+    for name in ("one", "two"):
+        tmp_path.joinpath(name).mkdir()
+        shutil.copy("tests/files/poetry_pyproject.toml", tmp_path / name / "pyproject.toml")
+    json_file = tmp_path / "profile.json"
+    mocker.patch(
+        "sys.argv",
+        ["convert_poetry2uv.py", str(tmp_path), "-n", "-j", "2", "--profile"]
+        + ["--profile-json", str(json_file), "--no-cache"],
+    )
+    convert_poetry2uv.main()
+    assert "stage" in capsys.readouterr().out
+    profile = json.loads(json_file.read_text())
+    assert profile["dependency_model"]["calls"] == 2
+    assert profile["serialization"]["seconds"] > 0
+
+
+@pytest.fixture
+def git_repo(tmp_path):
+    """A git repository with a Poetry project on main and a converted one on a branch."""
+    repo = tmp_path / "repo"
+    project = repo / "sub"
+    project.mkdir(parents=True)
+
+    def git(*args):
+        cmd = ["git", "-C", str(repo), "-c", "user.name=test", "-c", "user.email=t@test.nl"]
+        subprocess.run([*cmd, *args], check=True, capture_output=True)  # noqa: S603
+
+    git("init", "-b", "main")
+    shutil.copy("tests/files/lock_pyproject.toml", project / "pyproject.toml")
+    shutil.copy("tests/files/lock_poetry.lock", project / "poetry.lock")
+    git("add", ".")
+    git("commit", "-m", "poetry")
+    git("tag", "v1")
+    git("checkout", "-b", "uv")
+    shutil.copy("tests/files/poetry_pyproject_converted.toml", project / "pyproject.toml")
+    git("commit", "-am", "uv")
+    git("checkout", "main")
+    project.joinpath("pyproject.toml").write_text("not even toml [")
+    return repo
+
+
+def test_convert_git_refs(git_repo):
+    results = convert_poetry2uv.convert_git_refs(
+        git_repo / "sub", ["v1", "uv", "missing"], lock=True
+    )
+    assert [(r.source, r.status) for r in results] == [
+        ("v1:sub/pyproject.toml", "converted"),
+        ("uv:sub/pyproject.toml", "skipped"),
+        ("missing:sub/pyproject.toml", "failed"),
+    ]
+    assert "Converted v1:sub/poetry.lock into uv.lock" in results[0].message
+    assert results[2].message == "Git ref not found"
+    # The worktree is neither checked out nor written to.
+    assert git_repo.joinpath("sub/pyproject.toml").read_text() == "not even toml ["
+    assert not git_repo.joinpath("sub/uv.lock").exists()
+
+
+def test_convert_git_refs_missing_file(git_repo):
+    results = convert_poetry2uv.convert_git_refs(git_repo / "other", ["v1"])
+    assert [(r.status, r.message) for r in results] == [("skipped", "File not found")]
+
+
+def test_git_object_reader_missing_path_with_spaces(git_repo):
+    with convert_poetry2uv.GitObjectReader(git_repo) as reader:
+        assert reader.read("v1", "my proj/LICENSE") is None
+        assert reader.read("v1", "my other proj/sub/LICENSE") is None
+        assert reader.read("v1", "sub/pyproject.toml").startswith(b"[tool.poetry]")
+
+
+def test_convert_git_refs_reads_blobs_once(mocker, git_repo):
+    read = mocker.spy(convert_poetry2uv.GitObjectReader, "read")
+    convert_poetry2uv.convert_git_refs(git_repo / "sub", ["v1"], lock=True)
+    paths = [call.args[2] for call in read.call_args_list]
+    assert sorted(paths) == ["sub/poetry.lock", "sub/pyproject.toml"]
+
+
+def test_main_git_ref_not_a_repo(mocker, tmp_path, capsys):
+    tmp_path.joinpath("a").mkdir()
+    mocker.patch(
+        "sys.argv",
+        ["convert_poetry2uv.py", str(tmp_path / "a/pyproject.toml"), "--git-ref", "main"],
+    )
+    with pytest.raises(SystemExit) as exc:
+        convert_poetry2uv.main()
+    assert exc.value.code == 1
+    assert "FAILED    main:" in capsys.readouterr().out
+
+
+def test_main_git_ref(mocker, git_repo, capsys):
+    mocker.patch(
+        "sys.argv",
+        ["convert_poetry2uv.py", str(git_repo / "sub/pyproject.toml"), "--git-ref", "main"]
+        + ["--git-ref", "v1"],
+    )
+    convert_poetry2uv.main()
+    out = capsys.readouterr().out
+    assert "CONVERTED main:sub/pyproject.toml" in out
+    assert "CONVERTED v1:sub/pyproject.toml" in out
+
+
+def test_convert(toml_obj):
+    text = Path("tests/files/v2_poetry_pyproject.toml").read_text()
+    got = tomlkit.loads(convert_poetry2uv.convert(text))
+    assert got == toml_obj("tests/files/v2_poetry_pyproject_converted.toml")
+
+
+def test_convert_golden_text():
+    # The text, not only the parsed document: the layout of the output is part of it.
+    text = Path("tests/files/poetry_pyproject.toml").read_text()
+    output = convert_poetry2uv.convert(text, project_dir=Path("tests/files"))
+    assert output == Path("tests/files/poetry_pyproject_golden.toml").read_text()
+    assert "]\n\n[project.urls]" in output
+
+
+def test_convert_errors():
+    with pytest.raises(convert_poetry2uv.ConversionError, match="Poetry section not found"):
+        convert_poetry2uv.convert('[project]\nname = "x"\n')
+    with pytest.raises(convert_poetry2uv.ConversionError, match="Name field not found"):
+        convert_poetry2uv.convert("[tool.poetry]\n")
+
+
+def test_convert_document_dict(org_toml, tmp_path):
+    org_toml["tool"]["poetry"].update({"name": "x", "version": "1", "license": "LICENSE"})
+    got = convert_poetry2uv.convert_document(org_toml)
+    assert got["project"]["license"] == {"text": "LICENSE"}
+    tmp_path.joinpath("LICENSE").touch()
+    got = convert_poetry2uv.convert_document(org_toml, project_dir=tmp_path)
+    assert got["project"]["license"] == {"file": "LICENSE"}
+    assert got["dependency-groups"] == {"dev": ["mypy>=1.0.1,<2"]}
+
+
+def test_convert_threads():
+    files = [
+        "tests/files/poetry_pyproject.toml",
+        "tests/files/v2_poetry_pyproject.toml",
+        "tests/files/editable_sources.toml",
+        "tests/files/v2_local_deps.toml",
+    ]
+    texts = [Path(f).read_text() for f in files] * 25
+    expected = [convert_poetry2uv.convert(t) for t in texts]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        assert list(executor.map(convert_poetry2uv.convert, texts)) == expected
+
+
+def test_serve(tmp_path):
+    tmp_path.joinpath("LICENSE").touch()
+    filename = tmp_path / "pyproject.toml"
+    shutil.copy("tests/files/poetry_pyproject.toml", filename)
+    requests = [
+        json.dumps({"id": 1, "text": Path("tests/files/v2_poetry_pyproject.toml").read_text()}),
+        "",
+        json.dumps({"id": 2, "path": str(filename)}),
+        json.dumps({"id": 3, "text": '[project]\nname = "x"\n'}),
+        "not json",
+    ]
+    out = io.StringIO()
+    convert_poetry2uv.serve(io.StringIO("\n".join(requests) + "\n"), out)
+    responses = [json.loads(line) for line in out.getvalue().splitlines()]
+
+    assert [(r["id"], r["ok"]) for r in responses] == [
+        (1, True),
+        (2, True),
+        (3, False),
+        (None, False),
+    ]
+    assert responses[0]["warnings"] == ["Poetry build system detected. It will be removed."]
+    assert responses[0]["diagnostics"][0]["code"] == "build-system-removed"
+    assert tomlkit.loads(responses[1]["output"])["project"]["license"] == {"file": "LICENSE"}
+    assert "Poetry section not found" in responses[2]["error"]
+    assert responses[3]["error"].startswith("JSONDecodeError")
+    assert all(r["seconds"] >= 0 for r in responses)
+
+
+def test_serve_socket(tmp_path):
+    path = tmp_path / "convert.sock"
+    server = convert_poetry2uv.socket_server(path)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+
+    text = Path("tests/files/poetry_pyproject.toml").read_text()
+    try:
+        with socket.socket(socket.AF_UNIX) as client:
+            client.connect(str(path))
+            with client.makefile("rw", encoding="utf-8") as stream:
+                for i in range(3):
+                    stream.write(json.dumps({"id": i, "text": text}) + "\n")
+                    stream.flush()
+                    response = json.loads(stream.readline())
+                    assert (response["id"], response["ok"]) == (i, True)
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+def test_socket_server_keeps_other_files(tmp_path):
+    path = tmp_path / "pyproject.toml"
+    path.write_text("keep me")
+    with pytest.raises(FileExistsError, match="is not a socket"):
+        convert_poetry2uv.socket_server(path)
+    assert path.read_text() == "keep me"
+
+
+def test_socket_server_replaces_stale_socket(tmp_path):
+    path = tmp_path / "convert.sock"
+    with socket.socket(socket.AF_UNIX) as stale:
+        stale.bind(str(path))
+    convert_poetry2uv.socket_server(path).server_close()
+    assert stat.S_ISSOCK(path.lstat().st_mode)
+
+
+def test_write_atomic_failure(mocker, tmp_path):
+    filename = tmp_path / "pyproject.toml"
+    filename.write_text("original")
+    mocker.patch.object(Path, "replace", side_effect=OSError("disk full"))
+    with pytest.raises(OSError, match="disk full"):
+        convert_poetry2uv.write_atomic(filename, "new")
+    assert filename.read_text() == "original"
+    assert list(tmp_path.iterdir()) == [filename]
+
+
+def test_convert_project_keeps_original_on_failure(mocker, tmp_path):
+    filename = tmp_path / "pyproject.toml"
+    shutil.copy("tests/files/poetry_pyproject.toml", filename)
+    mocker.patch.object(convert_poetry2uv, "write_atomic", side_effect=OSError("disk full"))
+    with pytest.raises(OSError):
+        convert_poetry2uv.convert_project(filename)
+    assert filename.read_text() == Path("tests/files/poetry_pyproject.toml").read_text()
+    assert tmp_path.joinpath("pyproject.toml.org").read_text() == filename.read_text()
+
+
+def test_convert_project_fsync(mocker, tmp_path):
+    filename = tmp_path / "pyproject.toml"
+    shutil.copy("tests/files/poetry_pyproject.toml", filename)
+    fsync = mocker.spy(os, "fsync")
+    convert_poetry2uv.convert_project(filename, sync="file")
+    # The new file, its directory and the directory of the backup.
+    assert fsync.call_count == 3
+
+
+def test_convert_project_fsync_copied_backup(mocker, tmp_path):
+    filename = tmp_path / "pyproject.toml"
+    shutil.copy("tests/files/poetry_pyproject.toml", filename)
+    mocker.patch.object(os, "link", side_effect=OSError("not supported"))
+    fsync = mocker.spy(os, "fsync")
+    convert_poetry2uv.convert_project(filename, sync="file")
+    # The copied backup is persisted as well, before it replaces the old one.
+    assert fsync.call_count == 4
+    assert tmp_path.joinpath("pyproject.toml.org").read_text() == (
+        Path("tests/files/poetry_pyproject.toml").read_text()
+    )
+
+
+def test_journal_restore(mocker, monkeypatch, tmp_path):
+    journal = tmp_path / "journal.jsonl"
+    project_root = Path.cwd()
+    for name in ("one", "two"):
+        tmp_path.joinpath(name).mkdir()
+        shutil.copy("tests/files/lock_pyproject.toml", tmp_path / name / "pyproject.toml")
+        shutil.copy("tests/files/lock_poetry.lock", tmp_path / name / "poetry.lock")
+    tmp_path.joinpath("two/uv.lock").write_text("old lock")
+    monkeypatch.chdir(tmp_path)
+    mocker.patch(
+        "sys.argv",
+        ["convert_poetry2uv.py", "one", "two", "--lock", "--journal", str(journal)]
+        + ["-j", "2", "--sync", "batch"],
+    )
+    convert_poetry2uv.main()
+    assert len(journal.read_text().splitlines()) == 2
+    assert tmp_path.joinpath("one/uv.lock").exists()
+    assert tmp_path.joinpath("two/uv.lock.org").read_text() == "old lock"
+
+    # The journal holds absolute paths, it is restored from anywhere.
+    monkeypatch.chdir(project_root)
+    mocker.patch("sys.argv", ["convert_poetry2uv.py", "--restore", str(journal)])
+    convert_poetry2uv.main()
+    original = (project_root / "tests/files/lock_pyproject.toml").read_text()
+    assert sorted(p.name for p in tmp_path.joinpath("one").iterdir()) == [
+        "poetry.lock",
+        "pyproject.toml",
+    ]
+    assert sorted(p.name for p in tmp_path.joinpath("two").iterdir()) == [
+        "poetry.lock",
+        "pyproject.toml",
+        "uv.lock",
+    ]
+    assert tmp_path.joinpath("two/uv.lock").read_text() == "old lock"
+    for name in ("one", "two"):
+        assert tmp_path.joinpath(name, "pyproject.toml").read_text() == original
+
+
+def test_main_check(mocker, tmp_path, capsys):
+    filename = tmp_path / "pyproject.toml"
+    shutil.copy("tests/files/poetry_pyproject.toml", filename)
+    mocker.patch("sys.argv", ["convert_poetry2uv.py", str(filename), "--check"])
+    with pytest.raises(SystemExit) as exc:
+        convert_poetry2uv.main()
+    assert exc.value.code == 1
+    assert "differs from the conversion" in capsys.readouterr().out
+    assert [p.name for p in tmp_path.iterdir()] == ["pyproject.toml"]
+
+    # Once converted, the conversion of the backup matches the converted file.
+    convert_poetry2uv.convert_project(filename)
+    capsys.readouterr()
+    convert_poetry2uv.main()
+    assert capsys.readouterr().out.endswith(f"{filename} is up to date\n")
+
+
+def test_main_check_expected_diff(mocker, tmp_path, capsys):
+    filename = tmp_path / "pyproject.toml"
+    shutil.copy("tests/files/poetry_pyproject.toml", filename)
+    convert_poetry2uv.convert_project(filename, dry_run=True)
+    golden = tmp_path / "pyproject_temp_uv.toml"
+    mocker.patch(
+        "sys.argv",
+        ["convert_poetry2uv.py", str(filename), "--check", "--expected", golden.name, "--diff"],
+    )
+    convert_poetry2uv.main()
+    capsys.readouterr()
+
+    golden.write_text(golden.read_text().replace('name = "name of the project"', 'name = "other"'))
+    with pytest.raises(SystemExit):
+        convert_poetry2uv.main()
+    out = capsys.readouterr().out
+    assert '-name = "other"\n+name = "name of the project"' in out
+    assert filename.read_text() == Path("tests/files/poetry_pyproject.toml").read_text()
+
+
+def test_check_batch(tmp_path):
+    for name in ("one", "two"):
+        tmp_path.joinpath(name).mkdir()
+        shutil.copy("tests/files/poetry_pyproject.toml", tmp_path / name / "pyproject.toml")
+    convert_poetry2uv.convert_project(tmp_path / "one/pyproject.toml")
+    results = convert_poetry2uv.convert_batch(
+        convert_poetry2uv.discover_projects([str(tmp_path)]), jobs=2, check=True
+    )
+    assert [r.status for r in results] == ["unchanged", "changed"]
+
+
+@pytest.mark.parametrize(
+    "requirement, expected",
+    [
+        ["requests>=2.31.0", "requests>=2.32.3"],
+        ["requests[socks]>=2.31.0,<3", "requests[socks]>=2.32.3,<3"],
+        ["requests", "requests>=2.32.3"],
+        ["requests==2.31.0", "requests==2.31.0"],
+        ["requests>2; python_version < '3.11'", "requests>=2.32.3; python_version < '3.11'"],
+        ["requests (>=2.31.0,<3.0.0)", "requests>=2.32.3,<3.0.0"],
+        ["requests[socks] (>=2.31.0)", "requests[socks]>=2.32.3"],
+    ],
+)
+def test_seed_requirement(requirement, expected):
+    assert convert_poetry2uv.seed_requirement(requirement, "2.32.3") == expected
+
+
+@pytest.mark.parametrize(
+    "seed, expected",
+    [
+        ["bounds", {"dependencies": ["requests>=2.32.3,<3"], "dev": ["colorama>=0.4.6"]}],
+        ["constraints", {"dependencies": ["requests>=2.31.0,<3"], "dev": ["colorama"]}],
+    ],
+)
+def test_convert_project_seed(tmp_path, seed, expected):
+    shutil.copy("tests/files/lock_pyproject.toml", tmp_path / "pyproject.toml")
+    shutil.copy("tests/files/lock_poetry.lock", tmp_path / "poetry.lock")
+    result = convert_poetry2uv.convert_project(tmp_path / "pyproject.toml", seed=seed)
+    assert result.status == "converted"
+
+    got = tomlkit.loads(tmp_path.joinpath("pyproject.toml").read_text()).unwrap()
+    assert got["project"]["dependencies"] == expected["dependencies"]
+    assert got["dependency-groups"]["dev"] == expected["dev"]
+    constraints = got.get("tool", {}).get("uv", {}).get("constraint-dependencies")
+    if seed == "constraints":
+        assert constraints == [
+            "certifi==2024.8.30",
+            "colorama==0.4.6",
+            "idna==3.10",
+            "requests==2.32.3",
+        ]
+        assert "Pinned 4 packages" in result.message
+    else:
+        assert constraints is None
+        assert "Raised the lower bounds of 2 requirements" in result.message
+
+
+def test_convert_project_seed_outdated(tmp_path):
+    shutil.copy("tests/files/lock_pyproject.toml", tmp_path / "pyproject.toml")
+    with tmp_path.joinpath("pyproject.toml").open("a") as fh:
+        fh.write('\n[tool.poetry.group.docs.dependencies]\nmkdocs = "*"\n')
+    shutil.copy("tests/files/lock_poetry.lock", tmp_path / "poetry.lock")
+    result = convert_poetry2uv.convert_project(tmp_path / "pyproject.toml", seed="bounds")
+    assert "is out of date with pyproject.toml, the constraints are not seeded" in result.message
+
+
+@pytest.fixture
+def monorepo(tmp_path):
+    """A git repository with three Poetry projects, b depends on a by path."""
+    repo = tmp_path / "mono"
+    for name in ("a", "b", "c"):
+        repo.joinpath(name).mkdir(parents=True)
+        shutil.copy("tests/files/poetry_pyproject.toml", repo / name / "pyproject.toml")
+    with repo.joinpath("b/pyproject.toml").open("a") as fh:
+        fh.write(
+            '\n[tool.poetry.group.local.dependencies]\na = { path = "../a", develop = true }\n'
+        )
+
+    def git(*args):
+        cmd = ["git", "-C", str(repo), "-c", "user.name=test", "-c", "user.email=t@test.nl"]
+        subprocess.run([*cmd, *args], check=True, capture_output=True)  # noqa: S603
+
+    git("init", "-b", "main")
+    git("add", ".")
+    git("commit", "-m", "projects")
+    return repo
+
+
+def test_affected_projects(monorepo):
+    project_files = convert_poetry2uv.discover_projects([str(monorepo)])
+    monorepo.joinpath("a/README.md").write_text("changed")
+    changed = convert_poetry2uv.changed_files("main", [monorepo / "a"])
+    assert changed == {monorepo.resolve() / "a/README.md"}
+    affected = convert_poetry2uv.affected_projects(project_files, changed)
+    assert sorted(p.parent.name for p in affected) == ["a", "b"]
+
+    changed = {monorepo.resolve() / "b/pyproject.toml", monorepo.resolve() / "other.txt"}
+    affected = convert_poetry2uv.affected_projects(project_files, changed)
+    assert [p.parent.name for p in affected] == ["b"]
+
+
+def test_main_changed_since(mocker, monorepo, capsys):
+    with monorepo.joinpath("c/pyproject.toml").open("a") as fh:
+        fh.write("\n[tool.black]\nline-length = 100\n")
+    mocker.patch(
+        "sys.argv", ["convert_poetry2uv.py", str(monorepo), "-n", "--changed-since", "main"]
+    )
+    convert_poetry2uv.main()
+    assert "1 files: 1 converted" in capsys.readouterr().out
+    converted = sorted(p.parent.name for p in monorepo.glob("*/pyproject_temp_uv.toml"))
+    assert converted == ["c"]
+
+    mocker.patch("sys.argv", ["convert_poetry2uv.py", str(monorepo), "--changed-since", "unknown"])
+    with pytest.raises(SystemExit) as exc:
+        convert_poetry2uv.main()
+    assert exc.value.code == 1
+
+
+def test_iter_convert_flat_memory(tmp_path):
+    text = '[tool.poetry]\nname = "p"\nversion = "1"\n\n[tool.poetry.dependencies]\nfoo = "^1"\n'
+    count = 20_000
+    for i in range(count):
+        project = tmp_path / str(i // 100) / str(i)
+        project.mkdir(parents=True)
+        project.joinpath("pyproject.toml").write_text(text)
+
+    statuses = Counter()
+    projects = convert_poetry2uv.iter_projects([str(tmp_path)])
+    # In a single process, so the converted documents count in RUSAGE_SELF.
+    for i, result in enumerate(convert_poetry2uv.iter_convert(projects, jobs=1, check=True)):
+        statuses[result.status] += 1
+        if i == 2_000:
+            warm = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    assert statuses == {"changed": count}
+    # ru_maxrss is in KiB, the documents are never all kept around.
+    assert resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - warm < 16 * 1024
+
+
+def test_convert_workspace(monorepo, toml_obj):
+    results = list(convert_poetry2uv.convert_workspace(monorepo, dry_run=True))
+    assert [r.status for r in results] == ["converted"] * 4
+    assert results[-1].path == monorepo.resolve() / "pyproject.toml"
+
+    root = toml_obj(monorepo / "pyproject_temp_uv.toml")
+    assert root == {"tool": {"uv": {"workspace": {"members": ["a", "b", "c"]}}}}
+    member = toml_obj(monorepo / "b/pyproject_temp_uv.toml")
+    assert member["tool"]["uv"]["sources"] == {"a": {"workspace": True}}
+    assert member["dependency-groups"]["local"] == ["a"]
+
+
+def test_main_workspace_root_project(mocker, monorepo, toml_obj):
+    shutil.copy("tests/files/poetry_pyproject.toml", monorepo / "pyproject.toml")
+    mocker.patch("sys.argv", ["convert_poetry2uv.py", str(monorepo), "--workspace", "-j", "2"])
+    convert_poetry2uv.main()
+    root = toml_obj(monorepo / "pyproject.toml")
+    assert root["project"]["name"] == "name of the project"
+    assert root["tool"]["uv"]["workspace"] == {"members": ["a", "b", "c"]}
+    assert "[tool.poetry]" in monorepo.joinpath("pyproject.toml.org").read_text()
+
+
+def test_argparser_workspace_lock(mocker, monorepo):
+    mocker.patch("sys.argv", ["convert_poetry2uv.py", str(monorepo), "--workspace", "--lock"])
+    with pytest.raises(SystemExit):
+        convert_poetry2uv.argparser()
+
+
+def test_iter_prefetched(tmp_path):
+    project_files = []
+    for name in ("one", "two", "three"):
+        tmp_path.joinpath(name).mkdir()
+        project_files.append(tmp_path / name / "pyproject.toml")
+        project_files[-1].write_text(name)
+    tmp_path.joinpath("two/LICENSE").touch()
+    project_files.append(tmp_path / "missing/pyproject.toml")
+
+    prefetched = list(convert_poetry2uv.iter_prefetched(project_files))
+    assert [project_file for project_file, _ in prefetched] == project_files
+    files = prefetched[1][1]
+    assert files.contents == {"pyproject.toml": b"two"}
+    tmp_path.joinpath("two/LICENSE").unlink()
+    assert files.exists("LICENSE")  # Answered from the listing read ahead.
+    assert files.read("pyproject.toml") == b"two"
+    assert prefetched[3][1].read("pyproject.toml") is None
+
+
+def test_project_files_lines_mmap(mocker, tmp_path):
+    lock = Path("tests/files/lock_poetry.lock").read_text()
+    tmp_path.joinpath("poetry.lock").write_bytes(lock.replace("\n", "\r\n").encode())
+    files = convert_poetry2uv.ProjectFiles(tmp_path)
+    mocker.patch.object(convert_poetry2uv, "MMAP_MIN_SIZE", 0)
+    spy = mocker.spy(convert_poetry2uv.mmap, "mmap")
+    assert list(files.lines("poetry.lock")) == lock.splitlines(keepends=True)
+    spy.assert_called_once()
+
+
+def test_plugin_transforms(tmp_path, transform_plugin):
+    filename = tmp_path / "pyproject.toml"
+    filename.write_text(
+        '[tool.poetry]\nname = "x"\nversion = "1"\n\n[tool.poetry.group.dev.dependencies]\n'
+        'pytest = "^8.0"\n\n[tool.ruff]\nline-length = 100\n'
+    )
+    plugins = (f"{transform_plugin}:internal_index", f"{transform_plugin}:strip_dev")
+    result = convert_poetry2uv.convert_project(filename, plugins=plugins, profile=True)
+    assert result.status == convert_poetry2uv.CONVERTED
+    stages = list(result.profile)
+    assert stages[stages.index("equivalence") + 1 :][:3] == [
+        *(f"plugin:{spec}" for spec in plugins),
+        "serialization",
+    ]
+    converted = tomlkit.loads(filename.read_text())
+    assert "dev" not in converted["dependency-groups"]
+    assert converted["tool"]["uv"]["index"][0]["name"] == "internal"
+    assert converted["tool"]["ruff"]["line-length"] == 100
+
+
+def test_entry_point_specs(mocker, transform_plugin):
+    entry_points = [
+        convert_poetry2uv.metadata.EntryPoint(
+            name, f"{transform_plugin}:{name}", convert_poetry2uv.TRANSFORMS_GROUP
+        )
+        for name in ("strip_dev", "internal_index")
+    ]
+    lookup = mocker.patch.object(
+        convert_poetry2uv.metadata, "entry_points", return_value=entry_points
+    )
+    spec = f"{transform_plugin}:strip_dev"
+    mocker.patch("sys.argv", ["convert_poetry2uv.py", "x", "--entry-points", "--plugin", spec])
+    plugins = convert_poetry2uv.command_plugins(convert_poetry2uv.argparser())
+    lookup.assert_called_once_with(group=convert_poetry2uv.TRANSFORMS_GROUP)
+    assert plugins == (f"{transform_plugin}:internal_index", spec, spec)
+
+
+def test_conversion_cache_plugins(tmp_path, transform_plugin):
+    cache = convert_poetry2uv.ConversionCache(tmp_path / "cache")
+    content = b'[tool.poetry]\nname = "x"\n'
+    plain = cache.key(content, tmp_path, lock=False)
+    assert plain != cache.key(content, tmp_path, lock=False, transforms=["strip"])
+
+
+@pytest.mark.parametrize("spec", ["poetry2uv_plugin", "poetry2uv_plugin:missing", "nope:f"])
+def test_argparser_plugin_invalid(mocker, transform_plugin, spec):
+    mocker.patch("sys.argv", ["convert_poetry2uv.py", "pyproject.toml", "--plugin", spec])
+    with pytest.raises(SystemExit):
+        convert_poetry2uv.argparser()